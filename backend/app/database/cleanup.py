@@ -8,16 +8,72 @@ It implements ENV-DB-2.4.2 (Database reset function) and works with the
 table dependency map from ENV-DB-2.4.3.1.
 """
 import logging
-from typing import List, Optional, Set, Dict, Callable
-from sqlalchemy import text
+from concurrent.futures import ThreadPoolExecutor
+import os
+import queue
+from typing import List, Optional, Set, Dict, Callable, Tuple
+from sqlalchemy import bindparam, create_engine, text
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
 
-from app.utils.table_dependency import TableDependencyMap, get_dependency_map
+from app.utils.table_dependency import (
+    TableDependencyMap,
+    get_dependency_map,
+    quote_table_name,
+    truncate_statement
+)
 
 logger = logging.getLogger(__name__)
 
-def truncate_tables(engine: Engine, table_names: Optional[List[str]] = None) -> None:
+# Cleanup strategies:
+# - "truncate": TRUNCATE ... RESTART IDENTITY CASCADE (best for large tables)
+# - "delete": DELETE FROM each table, then reset serial sequences. Avoids the
+#   ACCESS EXCLUSIVE lock and relfile rewrite, which is faster for the small
+#   tables typical of unit tests and lets parallel test workers proceed.
+CLEANUP_STRATEGIES = ("truncate", "delete")
+CLEANUP_STRATEGY = os.environ.get("PG_CLEANUP_STRATEGY", "truncate")
+
+# Restart every serial/identity sequence owned by a column of the given tables
+RESET_SERIAL_SEQUENCES_SQL = text(
+    "SELECT setval(pg_get_serial_sequence(quote_ident(table_name), column_name), 1, false) "
+    "FROM information_schema.columns "
+    "WHERE table_schema = current_schema() "
+    "AND table_name IN :tables "
+    "AND pg_get_serial_sequence(quote_ident(table_name), column_name) IS NOT NULL"
+).bindparams(bindparam("tables", expanding=True))
+
+# Sequence names per (database, schema), populated on the first reset_sequences call
+_SEQUENCES_CACHE: Dict[Tuple[Optional[str], str], List[str]] = {}
+
+# Connection.info key caching the pooled connection's current schema
+_CURRENT_SCHEMA_INFO_KEY = "current_schema"
+
+# Pristine database cloned for each test by the template-pooled fixture
+TEMPLATE_DATABASE = os.environ.get("PG_TEMPLATE_DATABASE", "photo_gallery_clean")
+
+def _resolve_strategy(strategy: Optional[str]) -> str:
+    """
+    Apply the default cleanup strategy and validate it.
+    
+    Args:
+        strategy: "truncate", "delete", or None for CLEANUP_STRATEGY
+        
+    Returns:
+        The strategy to use
+    """
+    strategy = strategy or CLEANUP_STRATEGY
+    if strategy not in CLEANUP_STRATEGIES:
+        raise ValueError(f"Unknown cleanup strategy: {strategy}")
+    return strategy
+
+def truncate_tables(
+    engine: Engine,
+    table_names: Optional[List[str]] = None,
+    strategy: Optional[str] = None,
+    skip_empty: bool = False,
+    parallel: bool = False
+) -> None:
     """
     Truncate specified tables or all tables if none specified.
     Tables are truncated in the correct order based on foreign key constraints.
@@ -25,10 +81,68 @@ def truncate_tables(engine: Engine, table_names: Optional[List[str]] = None) ->
     Args:
         engine: SQLAlchemy engine to use for database operations
         table_names: List of table names to truncate, or None for all tables
+        strategy: "truncate" or "delete", defaults to CLEANUP_STRATEGY
+        skip_empty: Leave tables that are already empty untouched. Their
+            sequences are not restarted, so callers should reset sequences
+            separately.
+        parallel: Truncate tables that share no foreign keys concurrently,
+            one connection per group
     """
+    strategy = _resolve_strategy(strategy)
+    
     # Get dependency map to determine truncation order
     dependency_map = get_dependency_map(engine)
     
+    if not parallel or strategy != "truncate":
+        with engine.begin() as conn:
+            _truncate_tables(conn, dependency_map, table_names, strategy, skip_empty)
+        return
+    
+    with engine.connect() as conn:
+        truncation_order = _get_truncation_order(conn, dependency_map, table_names, skip_empty)
+    
+    # Group the tables by FK component; groups never reference each other
+    truncation_set = set(truncation_order)
+    groups = [
+        [table for table in component if table in truncation_set]
+        for component in dependency_map.components()
+    ]
+    groups = [group for group in groups if group]
+    
+    def truncate_group(group: List[str]) -> None:
+        with engine.begin() as conn:
+            _truncate_group(conn, group)
+    
+    # Don't use more connections than the engine's pool keeps open
+    pool_size = getattr(engine.pool, "size", None)
+    max_workers = min(len(groups), pool_size()) if callable(pool_size) else len(groups)
+    if max_workers > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(truncate_group, groups))
+    else:
+        for group in groups:
+            truncate_group(group)
+    
+    logger.info("Truncated %s tables", len(truncation_order))
+
+def _get_truncation_order(
+    conn,
+    dependency_map: TableDependencyMap,
+    table_names: Optional[List[str]] = None,
+    skip_empty: bool = False
+) -> List[str]:
+    """
+    Determine which tables to empty, child tables first.
+    
+    Args:
+        conn: Open SQLAlchemy connection
+        dependency_map: Dependency map of the database
+        table_names: List of table names to truncate, or None for all tables
+        skip_empty: Leave out tables that are already empty
+        
+    Returns:
+        Table names in truncation order
+    """
     # If no specific tables are provided, truncate all tables
     if table_names is None:
         table_names = dependency_map.tables
@@ -36,14 +150,12 @@ def truncate_tables(engine: Engine, table_names: Optional[List[str]] = None) ->
     # Determine truncation order for specified tables
     # If only a subset of tables is specified, we need to find dependencies
     if len(table_names) < len(dependency_map.tables):
-        # Get all tables that need to be truncated, including dependencies
-        tables_to_truncate = set(table_names)
-        
-        # Ensure the truncation set includes dependent tables
+        # Get all tables that need to be truncated, including dependent tables
         # Otherwise, foreign key constraints might be violated
-        for table in table_names:
-            dependent_tables = dependency_map.get_dependent_tables(table)
-            tables_to_truncate.update(dependent_tables)
+        all_descendants = dependency_map.all_descendants
+        tables_to_truncate = set(table_names).union(
+            *(all_descendants.get(table, frozenset()) for table in table_names)
+        )
         
         # Get ordered list of all tables
         all_tables_order = dependency_map.get_truncation_order()
@@ -54,22 +166,105 @@ def truncate_tables(engine: Engine, table_names: Optional[List[str]] = None) ->
         # If truncating all tables, use the complete truncation order
         truncation_order = dependency_map.get_truncation_order()
     
-    logger.debug(f"Truncating tables in order: {truncation_order}")
+    # Partitions are emptied through their partitioned parent
+    truncation_order = dependency_map.exclude_partitions(truncation_order)
     
-    with engine.begin() as conn:
-        # Temporarily disable foreign key constraints to allow truncation
-        conn.execute(text("SET CONSTRAINTS ALL DEFERRED"))
-        
-        # Truncate each table in the determined order
-        for table in truncation_order:
-            if table in table_names:
-                conn.execute(text(f'TRUNCATE TABLE "{table}" RESTART IDENTITY CASCADE'))
-                logger.debug(f"Truncated table: {table}")
+    if skip_empty and truncation_order:
+        non_empty_tables = _find_non_empty_tables(conn, truncation_order)
+        truncation_order = [t for t in truncation_order if t in non_empty_tables]
+    
+    logger.debug("Truncating tables in order: %s", truncation_order)
+    return truncation_order
+
+def _truncate_tables(
+    conn,
+    dependency_map: TableDependencyMap,
+    table_names: Optional[List[str]] = None,
+    strategy: Optional[str] = None,
+    skip_empty: bool = False
+) -> None:
+    """
+    Empty tables on an existing connection, inside the caller's transaction.
+    
+    Args:
+        conn: Open SQLAlchemy connection
+        dependency_map: Dependency map of the database
+        table_names: List of table names to truncate, or None for all tables
+        strategy: "truncate" or "delete", defaults to CLEANUP_STRATEGY
+        skip_empty: Leave tables that are already empty untouched
+    """
+    strategy = _resolve_strategy(strategy)
+    truncation_order = _get_truncation_order(conn, dependency_map, table_names, skip_empty)
+    
+    if not truncation_order:
+        logger.info("Truncated 0 tables")
+        return
+    
+    if strategy == "delete":
+        _delete_tables(conn, truncation_order)
+        return
+    
+    _truncate_group(conn, truncation_order)
+    logger.info("Truncated %s tables", len(truncation_order))
+
+def _truncate_group(conn, tables: List[str]) -> None:
+    """
+    Truncate a group of tables in a single statement. PostgreSQL processes the
+    whole set atomically, so FK ordering and constraint deferral are not needed.
+    
+    Args:
+        conn: Open SQLAlchemy connection
+        tables: Table names to truncate
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        for table in tables:
+            logger.debug("Truncating table: %s", table)
+    
+    conn.execute(truncate_statement(tables))
+
+def _find_non_empty_tables(conn, tables: List[str]) -> Set[str]:
+    """
+    Find which of the given tables contain at least one row.
+    
+    Uses an exact EXISTS probe per table, combined into a single query.
+    Statistics views such as pg_stat_user_tables are updated asynchronously
+    and can report a table as empty right after rows were inserted.
+    
+    Args:
+        conn: Open SQLAlchemy connection
+        tables: Table names to check
         
-        # Re-enable foreign key constraints
-        conn.execute(text("SET CONSTRAINTS ALL IMMEDIATE"))
+    Returns:
+        Set of table names that are not empty
+    """
+    if not tables:
+        return set()
     
-    logger.info(f"Truncated {len(truncation_order)} tables")
+    probe_query = " UNION ALL ".join(
+        f"SELECT '{_quote_literal(table)}' WHERE EXISTS (SELECT 1 FROM {quote_table_name(table)})"
+        for table in tables
+    )
+    return {row[0] for row in conn.execute(text(probe_query))}
+
+def _delete_tables(conn, deletion_order: List[str]) -> None:
+    """
+    Empty tables with DELETE FROM and restart their serial sequences.
+    
+    Args:
+        conn: Open SQLAlchemy connection
+        deletion_order: Table names ordered child tables first
+    """
+    # Defer deferrable constraints so rows in FK cycles can be deleted
+    conn.execute(text("SET CONSTRAINTS ALL DEFERRED"))
+    
+    for table in deletion_order:
+        conn.execute(text(f"DELETE FROM {quote_table_name(table)}"))
+        logger.debug("Deleted rows from table: %s", table)
+    
+    # Restart all owned sequences in a single round-trip
+    conn.execute(RESET_SERIAL_SEQUENCES_SQL, {"tables": deletion_order})
+    
+    logger.info("Deleted rows from %s tables", len(deletion_order))
 
 def reset_sequences(engine: Engine, sequences: Optional[List[str]] = None) -> None:
     """
@@ -80,20 +275,75 @@ def reset_sequences(engine: Engine, sequences: Optional[List[str]] = None) -> No
         sequences: List of sequence names to reset, or None for all sequences
     """
     with engine.begin() as conn:
-        # If no specific sequences provided, get all sequences from the database
+        _reset_sequences(conn, sequences, engine.url.database)
+
+def _current_schema(conn) -> str:
+    """
+    Get the connection's current schema, queried once per pooled connection.
+    
+    Args:
+        conn: Open SQLAlchemy connection
+        
+    Returns:
+        Name of the schema that unqualified names resolve to
+    """
+    schema = conn.info.get(_CURRENT_SCHEMA_INFO_KEY)
+    if schema is None:
+        schema = conn.execute(text("SELECT current_schema()")).scalar()
+        conn.info[_CURRENT_SCHEMA_INFO_KEY] = schema
+    return schema
+
+def _reset_sequences(
+    conn,
+    sequences: Optional[List[str]] = None,
+    database: Optional[str] = None
+) -> None:
+    """
+    Reset sequences on an existing connection, inside the caller's transaction.
+    
+    Args:
+        conn: Open SQLAlchemy connection
+        sequences: List of sequence names to reset, or None for all sequences
+        database: Database name used, with the current schema, as the
+            sequence cache key
+    """
+    # If no specific sequences provided, get all sequences from the current
+    # schema. The sequence set does not change during a test session, so it
+    # is cached per database and schema.
+    if sequences is None:
+        cache_key = (database, _current_schema(conn))
+        sequences = _SEQUENCES_CACHE.get(cache_key)
         if sequences is None:
             result = conn.execute(text(
                 "SELECT sequencename FROM pg_sequences "
-                "WHERE schemaname = 'public'"
+                "WHERE schemaname = current_schema()"
             ))
             sequences = [row[0] for row in result]
-        
-        # Reset each sequence to 1
+            _SEQUENCES_CACHE[cache_key] = sequences
+    
+    # Reset every sequence to 1 in a single round-trip. The batch goes through
+    # exec_driver_sql so it is sent without parameters, which psycopg 3
+    # requires for multiple statements in one call.
+    if sequences:
+        conn.exec_driver_sql("; ".join(
+            f'ALTER SEQUENCE "{sequence}" RESTART WITH 1' for sequence in sequences
+        ))
+    
+    if logger.isEnabledFor(logging.DEBUG):
         for sequence in sequences:
-            conn.execute(text(f'ALTER SEQUENCE "{sequence}" RESTART WITH 1'))
-            logger.debug(f"Reset sequence: {sequence}")
+            logger.debug("Reset sequence: %s", sequence)
     
-    logger.info(f"Reset {len(sequences)} sequences")
+    logger.info("Reset %s sequences", len(sequences))
+
+def reset_sequences_cache() -> None:
+    """
+    Forget cached sequence names, e.g. after a test alters the schema.
+    """
+    _SEQUENCES_CACHE.clear()
+
+def _quote_literal(value: str) -> str:
+    """Escape a value for use inside a single-quoted SQL string literal."""
+    return value.replace("'", "''")
 
 def verify_clean_state(engine: Engine) -> Dict[str, bool]:
     """
@@ -103,6 +353,21 @@ def verify_clean_state(engine: Engine) -> Dict[str, bool]:
     Args:
         engine: SQLAlchemy engine to use for database operations
         
+    Returns:
+        Dictionary with verification results for each check
+    """
+    dependency_map = get_dependency_map(engine)
+    with engine.begin() as conn:
+        return _verify_clean_state(conn, dependency_map)
+
+def _verify_clean_state(conn, dependency_map: TableDependencyMap) -> Dict[str, bool]:
+    """
+    Verify the clean state on an existing connection.
+    
+    Args:
+        conn: Open SQLAlchemy connection
+        dependency_map: Dependency map of the database
+        
     Returns:
         Dictionary with verification results for each check
     """
@@ -113,62 +378,70 @@ def verify_clean_state(engine: Engine) -> Dict[str, bool]:
         "settings_correct": True
     }
     
-    with engine.begin() as conn:
-        # 1. Check that all tables exist
-        dependency_map = get_dependency_map(engine)
-        expected_tables = set(dependency_map.tables)
-        
-        # 2. Check that all tables are empty
-        for table in expected_tables:
-            result = conn.execute(text(f'SELECT COUNT(*) FROM "{table}"'))
-            count = result.scalar()
-            if count > 0:
-                logger.warning(f"Table {table} is not empty: {count} rows")
-                results["tables_empty"] = False
-        
-        # 3. Check that sequences are reset to the appropriate values
-        result = conn.execute(text(
-            "SELECT sequencename, last_value FROM pg_sequences "
-            "WHERE schemaname = 'public'"
-        ))
-        
-        for row in result:
-            sequence_name, last_value = row
-            # Most sequences should be at 1 in a clean state
-            if last_value != 1:
-                logger.warning(f"Sequence {sequence_name} is not reset: {last_value}")
-                results["sequences_reset"] = False
-        
-        # 4. Check database settings
-        # This could be extended to check specific settings from the configuration
-        # For now, just check a few critical settings
-        result = conn.execute(text("SHOW search_path"))
-        search_path = result.scalar()
-        if "public" not in search_path:
-            logger.warning(f"Unexpected search_path: {search_path}")
-            results["settings_correct"] = False
+    # 1. Check that all tables exist
+    expected_tables = set(dependency_map.tables)
+    
+    # 2. Check that all tables are empty, probing every table in one query
+    for table in sorted(_find_non_empty_tables(conn, sorted(expected_tables))):
+        logger.warning("Table %s is not empty", table)
+        results["tables_empty"] = False
+    
+    # 3. Check that sequences are reset to the appropriate values
+    result = conn.execute(text(
+        "SELECT sequencename, last_value FROM pg_sequences "
+        "WHERE schemaname = current_schema()"
+    ))
+    
+    for row in result:
+        sequence_name, last_value = row
+        # Most sequences should be at 1 in a clean state
+        if last_value != 1:
+            logger.warning("Sequence %s is not reset: %s", sequence_name, last_value)
+            results["sequences_reset"] = False
+    
+    # 4. Check database settings
+    # This could be extended to check specific settings from the configuration
+    # For now, just check a few critical settings
+    result = conn.execute(text("SHOW search_path"))
+    search_path = result.scalar()
+    if "public" not in search_path:
+        logger.warning("Unexpected search_path: %s", search_path)
+        results["settings_correct"] = False
     
     return results
 
-def clean_database(engine: Engine) -> Dict[str, bool]:
+def clean_database(
+    engine: Engine,
+    strategy: Optional[str] = None,
+    verify: bool = False
+) -> Optional[Dict[str, bool]]:
     """
     Reset the database to a clean state by truncating all tables and
-    resetting all sequences.
+    resetting all sequences. All steps share a single transaction.
     
     Args:
         engine: SQLAlchemy engine to use for database operations
+        strategy: Cleanup strategy passed to truncate_tables
+        verify: Also run verify_clean_state, mainly useful when debugging
         
     Returns:
-        Dictionary with verification results after cleaning
+        Dictionary with verification results after cleaning, or None if
+        verification was not requested
     """
-    # Truncate all tables in the correct order
-    truncate_tables(engine)
+    dependency_map = get_dependency_map(engine)
     
-    # Reset all sequences
-    reset_sequences(engine)
+    with engine.begin() as conn:
+        # Truncate all non-empty tables in the correct order
+        _truncate_tables(conn, dependency_map, strategy=strategy, skip_empty=True)
+        
+        # Reset all sequences, including those of skipped empty tables
+        _reset_sequences(conn, database=engine.url.database)
+        
+        # Verify clean state if requested
+        if verify:
+            return _verify_clean_state(conn, dependency_map)
     
-    # Verify clean state
-    return verify_clean_state(engine)
+    return None
 
 def create_cleanup_fixture(engine_fixture: Callable) -> Callable:
     """
@@ -188,6 +461,8 @@ def create_cleanup_fixture(engine_fixture: Callable) -> Callable:
         - @pytest.mark.clean_before: Clean before the test
         - @pytest.mark.clean_after: Clean after the test
         - @pytest.mark.truncate_tables: Specify tables to truncate
+        - @pytest.mark.cleanup_strategy: Use "truncate" or "delete"
+        - @pytest.mark.verify_clean_state: Verify the clean state after cleaning
         
         Examples:
             @pytest.mark.clean_before
@@ -204,6 +479,12 @@ def create_cleanup_fixture(engine_fixture: Callable) -> Callable:
             def test_something(cleanup_db):
                 # Only users and posts tables are truncated
                 ...
+                
+            @pytest.mark.clean_before
+            @pytest.mark.cleanup_strategy("delete")
+            def test_something(cleanup_db):
+                # Tables are emptied with DELETE instead of TRUNCATE
+                ...
         """
         engine = engine_fixture(request)
         
@@ -211,18 +492,24 @@ def create_cleanup_fixture(engine_fixture: Callable) -> Callable:
         clean_before = request.node.get_closest_marker("clean_before") is not None
         clean_after = request.node.get_closest_marker("clean_after") is not None
         truncate_marker = request.node.get_closest_marker("truncate_tables")
+        strategy_marker = request.node.get_closest_marker("cleanup_strategy")
+        verify = request.node.get_closest_marker("verify_clean_state") is not None
         
         tables_to_truncate = None
         if truncate_marker is not None:
             tables_to_truncate = truncate_marker.args[0] if truncate_marker.args else None
         
+        strategy = None
+        if strategy_marker is not None:
+            strategy = strategy_marker.args[0] if strategy_marker.args else None
+        
         # Clean database before test if requested
         if clean_before:
             logger.info("Cleaning database before test")
             if tables_to_truncate:
-                truncate_tables(engine, tables_to_truncate)
+                truncate_tables(engine, tables_to_truncate, strategy=strategy)
             else:
-                clean_database(engine)
+                clean_database(engine, strategy=strategy, verify=verify)
         
         # Yield control to the test
         yield
@@ -231,51 +518,91 @@ def create_cleanup_fixture(engine_fixture: Callable) -> Callable:
         if clean_after:
             logger.info("Cleaning database after test")
             if tables_to_truncate:
-                truncate_tables(engine, tables_to_truncate)
+                truncate_tables(engine, tables_to_truncate, strategy=strategy)
             else:
-                clean_database(engine)
+                clean_database(engine, strategy=strategy, verify=verify)
     
     return _cleanup_fixture
 
 # Pre-configured fixtures for common cleanup patterns
+#
+# These factories take an engine that was created once per test session, e.g.
+#
+#     @pytest.fixture(scope="session")
+#     def db_engine():
+#         engine = mark_session_engine(get_engine(TEST_DATABASE_URL))
+#         yield engine
+#         engine.dispose()
+#
+# and only vary how often the database is cleaned. Creating an engine per
+# test would repeat the connect, pool fill and authentication every time.
+
+# Attribute set on engines created by a session-scoped fixture
+SESSION_ENGINE_ATTR = "_cleanup_session_scoped"
 
-def create_function_scoped_cleanup_fixture(engine_fixture: Callable) -> Callable:
+def mark_session_engine(engine: Engine) -> Engine:
+    """
+    Mark an engine as created by a session-scoped fixture.
+    
+    Args:
+        engine: SQLAlchemy engine shared by the whole test session
+        
+    Returns:
+        The same engine, for use as a return value
+    """
+    setattr(engine, SESSION_ENGINE_ATTR, True)
+    return engine
+
+def _require_session_engine(engine: Engine) -> None:
+    """
+    Check that an engine was marked with mark_session_engine.
+    
+    Args:
+        engine: SQLAlchemy engine passed to a fixture factory
+    """
+    if not getattr(engine, SESSION_ENGINE_ATTR, False):
+        raise ValueError(
+            "Cleanup fixtures need an engine from a session-scoped fixture; "
+            "wrap it with mark_session_engine()"
+        )
+
+def create_function_scoped_cleanup_fixture(engine: Engine) -> Callable:
     """
     Create a function-scoped fixture that cleans the database before each test.
     
     Args:
-        engine_fixture: Fixture function that provides the database engine
+        engine: Session-scoped engine marked with mark_session_engine
         
     Returns:
         Function-scoped fixture that cleans the database before each test
     """
-    def _fixture(request):
+    _require_session_engine(engine)
+    
+    def _fixture():
         """Clean the database before each test function."""
-        engine = engine_fixture(request)
-        
         # Clean database before test
         logger.info("Cleaning database before test function")
-        clean_database(engine)
+        clean_database(engine, verify=False)
         
         # Yield control to the test
         yield
     
     return _fixture
 
-def create_class_scoped_cleanup_fixture(engine_fixture: Callable) -> Callable:
+def create_class_scoped_cleanup_fixture(engine: Engine) -> Callable:
     """
     Create a class-scoped fixture that cleans the database before each test class.
     
     Args:
-        engine_fixture: Fixture function that provides the database engine
+        engine: Session-scoped engine marked with mark_session_engine
         
     Returns:
         Class-scoped fixture that cleans the database before each test class
     """
-    def _fixture(request):
+    _require_session_engine(engine)
+    
+    def _fixture():
         """Clean the database before each test class."""
-        engine = engine_fixture(request)
-        
         # Clean database before test class
         logger.info("Cleaning database before test class")
         clean_database(engine)
@@ -285,20 +612,20 @@ def create_class_scoped_cleanup_fixture(engine_fixture: Callable) -> Callable:
     
     return _fixture
 
-def create_module_scoped_cleanup_fixture(engine_fixture: Callable) -> Callable:
+def create_module_scoped_cleanup_fixture(engine: Engine) -> Callable:
     """
     Create a module-scoped fixture that cleans the database before each test module.
     
     Args:
-        engine_fixture: Fixture function that provides the database engine
+        engine: Session-scoped engine marked with mark_session_engine
         
     Returns:
         Module-scoped fixture that cleans the database before each test module
     """
-    def _fixture(request):
+    _require_session_engine(engine)
+    
+    def _fixture():
         """Clean the database before each test module."""
-        engine = engine_fixture(request)
-        
         # Clean database before test module
         logger.info("Cleaning database before test module")
         clean_database(engine)
@@ -306,4 +633,189 @@ def create_module_scoped_cleanup_fixture(engine_fixture: Callable) -> Callable:
         # Yield control to the test module
         yield
     
-    return _fixture
\ No newline at end of file
+    return _fixture
+
+def create_rollback_cleanup_fixture(engine_fixture: Callable) -> Callable:
+    """
+    Create a fixture that runs each test inside a transaction that is rolled
+    back afterwards, instead of truncating tables.
+    
+    The yielded session joins an outer transaction using SAVEPOINTs, so
+    session.commit() inside the test only releases a savepoint and the final
+    ROLLBACK discards all changes. Tests that need a real commit, e.g. because
+    they use a separate connection, can opt out with @pytest.mark.no_rollback,
+    which falls back to clean_database before the test.
+    
+    Args:
+        engine_fixture: Fixture function that provides the database engine
+        
+    Returns:
+        Fixture function yielding a SQLAlchemy session
+    """
+    def _fixture(request):
+        """Wrap each test in a transaction that is rolled back afterwards."""
+        engine = engine_fixture(request)
+        
+        if request.node.get_closest_marker("no_rollback") is not None:
+            logger.info("Cleaning database before test (no_rollback)")
+            clean_database(engine)
+            session = Session(bind=engine)
+            try:
+                yield session
+            finally:
+                session.close()
+            return
+        
+        conn = engine.connect()
+        trans = conn.begin()
+        session = Session(bind=conn, join_transaction_mode="create_savepoint")
+        try:
+            # Yield a session whose work is discarded after the test
+            yield session
+        finally:
+            session.close()
+            trans.rollback()
+            conn.close()
+    
+    return _fixture
+
+def _create_maintenance_engine(engine: Engine) -> Engine:
+    """
+    Create an autocommit engine on the "postgres" maintenance database of
+    the server that engine points to. CREATE/DROP DATABASE cannot run
+    inside a transaction or while connected to the target database.
+    
+    Args:
+        engine: SQLAlchemy engine for the test database
+        
+    Returns:
+        Engine connected to the maintenance database
+    """
+    return create_engine(
+        engine.url.set(database="postgres"),
+        isolation_level="AUTOCOMMIT",
+        poolclass=NullPool
+    )
+
+def prepare_template_database(
+    maintenance_engine: Engine,
+    template_name: str = TEMPLATE_DATABASE
+) -> None:
+    """
+    Mark a pristine, fully migrated database as a PostgreSQL template.
+    
+    Args:
+        maintenance_engine: Autocommit engine on the maintenance database
+        template_name: Name of the pristine database to mark
+    """
+    with maintenance_engine.connect() as conn:
+        conn.execute(text(f'ALTER DATABASE "{template_name}" IS_TEMPLATE true'))
+    logger.info("Prepared template database: %s", template_name)
+
+class TemplateDatabasePool:
+    """
+    Per-worker pool of database names cloned from a template database.
+    
+    Names are reused across tests so the number of databases stays bounded
+    across parametrized runs; close() drops every database the pool created.
+    """
+    
+    def __init__(self, maintenance_engine: Engine, base_url, template_name: str):
+        self.maintenance_engine = maintenance_engine
+        self.base_url = base_url
+        self.template_name = template_name
+        self.worker_id = os.environ.get("PYTEST_XDIST_WORKER", "master")
+        self._free: "queue.Queue[str]" = queue.Queue()
+        self._created: List[str] = []
+    
+    def acquire(self) -> str:
+        """Recreate a pooled database from the template and return its name."""
+        try:
+            db_name = self._free.get_nowait()
+        except queue.Empty:
+            db_name = f"test_{self.worker_id}_{len(self._created)}"
+            self._created.append(db_name)
+        
+        logger.info("Creating database %s from template %s", db_name, self.template_name)
+        with self.maintenance_engine.connect() as conn:
+            conn.execute(text(f'DROP DATABASE IF EXISTS "{db_name}"'))
+            conn.execute(text(f'CREATE DATABASE "{db_name}" TEMPLATE "{self.template_name}"'))
+        return db_name
+    
+    def release(self, db_name: str) -> None:
+        """Return a database name to the pool for the next test."""
+        self._free.put(db_name)
+    
+    def close(self) -> None:
+        """Drop every database the pool created and dispose the maintenance engine."""
+        try:
+            with self.maintenance_engine.connect() as conn:
+                for db_name in self._created:
+                    conn.execute(text(f'DROP DATABASE IF EXISTS "{db_name}"'))
+            logger.info("Dropped %d pooled test databases", len(self._created))
+        finally:
+            self.maintenance_engine.dispose()
+
+def create_template_pool_fixture(
+    engine_fixture: Callable,
+    template_name: str = TEMPLATE_DATABASE
+) -> Callable:
+    """
+    Create a session-scoped fixture that owns the template database pool.
+    
+    The fixture marks the template once, yields a TemplateDatabasePool and,
+    on teardown, drops the pooled databases and disposes the maintenance
+    engine.
+    
+    Args:
+        engine_fixture: Fixture function that provides the database engine
+        template_name: Name of the pristine template database
+        
+    Returns:
+        Session-scoped fixture function yielding a TemplateDatabasePool
+    """
+    def _fixture(request):
+        """Prepare the template and pool databases for the session."""
+        engine = engine_fixture(request)
+        maintenance_engine = _create_maintenance_engine(engine)
+        pool = TemplateDatabasePool(maintenance_engine, engine.url, template_name)
+        try:
+            prepare_template_database(maintenance_engine, template_name)
+            yield pool
+        finally:
+            pool.close()
+    
+    return _fixture
+
+def create_template_pooled_fixture(
+    pool_fixture_name: str = "template_database_pool"
+) -> Callable:
+    """
+    Create a fixture that gives each test a fresh copy of a template database.
+    
+    Instead of truncating tables, each test gets a database created with
+    CREATE DATABASE ... TEMPLATE, which PostgreSQL performs as a file-level
+    copy. Database names come from the session-scoped pool fixture built by
+    create_template_pool_fixture, which drops them at the end of the session.
+    
+    Args:
+        pool_fixture_name: Name of the session-scoped template pool fixture
+        
+    Returns:
+        Fixture function yielding an engine bound to the fresh database
+    """
+    def _fixture(request):
+        """Create a fresh database from the template for each test."""
+        pool = request.getfixturevalue(pool_fixture_name)
+        db_name = pool.acquire()
+        
+        test_engine = create_engine(pool.base_url.set(database=db_name))
+        try:
+            # Yield the engine bound to the fresh database
+            yield test_engine
+        finally:
+            # Disconnect so the database can be dropped and recreated later
+            test_engine.dispose()
+            pool.release(db_name)
+    
+    return _fixture
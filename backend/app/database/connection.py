@@ -5,16 +5,29 @@ Handles database connection setup, configuration, and management.
 
 import os
 import logging
+import threading
+import time
+import weakref
 from typing import Dict, Any, Optional
 from urllib.parse import quote_plus
 
 from sqlalchemy import create_engine, Engine, text
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import NullPool
+
+from app.database.retry_handler import register_statement_timeout
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Time of the last successful check_connection per engine
+_LAST_CONNECTION_OK: "weakref.WeakKeyDictionary[Engine, float]" = weakref.WeakKeyDictionary()
+
+# Engines shared by get_cached_engine, by database URL
+_CACHED_ENGINES: Dict[str, Engine] = {}
+_CACHED_ENGINES_LOCK = threading.Lock()
+
 # Default connection parameters
 DEFAULT_CONNECTION_PARAMS = {
     "connect_timeout": 10,
@@ -23,6 +36,29 @@ DEFAULT_CONNECTION_PARAMS = {
 }
 
 
+def _use_null_pool() -> bool:
+    """
+    Check whether engines should open a fresh connection per checkout instead
+    of pooling, as set by DB_POOL_MODE=null (e.g. behind pgbouncer).
+    
+    Returns:
+        bool: True if NullPool should be used
+    """
+    return os.environ.get("DB_POOL_MODE") == "null"
+
+
+def _async_commit() -> bool:
+    """
+    Check whether commits may skip waiting for the WAL flush, as set by the
+    test-only DB_TEST_ASYNC_COMMIT flag. Never enable it for real data: a
+    crash can lose the most recently committed transactions.
+    
+    Returns:
+        bool: True if DB_TEST_ASYNC_COMMIT is set to a true value
+    """
+    return os.environ.get("DB_TEST_ASYNC_COMMIT", "").lower() in ("1", "true", "yes")
+
+
 def get_database_url() -> str:
     """
     Get the database URL from environment variables or use a default value.
@@ -75,12 +111,20 @@ def create_connection_string(
     return connection_string
 
     
-def get_engine(database_url: Optional[str] = None, **kwargs) -> Engine:
+def get_engine(
+    database_url: Optional[str] = None,
+    statement_timeout_ms: Optional[int] = None,
+    **kwargs
+) -> Engine:
     """
     Create a SQLAlchemy engine for database connections with connection pooling.
     
     Args:
         database_url: Database connection URL, defaults to environment variable
+        statement_timeout_ms: Default statement timeout for every connection,
+            defaults to the DB_STATEMENT_TIMEOUT_MS environment variable (none
+            if unset). It is sent with the connection request, so it costs no
+            extra round-trip, and with_timeout skips its SET when it matches.
         **kwargs: Additional engine configuration parameters
     
     Returns:
@@ -89,15 +133,58 @@ def get_engine(database_url: Optional[str] = None, **kwargs) -> Engine:
     if database_url is None:
         database_url = get_database_url()
     
+    if statement_timeout_ms is None and os.environ.get("DB_STATEMENT_TIMEOUT_MS"):
+        statement_timeout_ms = int(os.environ["DB_STATEMENT_TIMEOUT_MS"])
+    
+    # psycopg 3 is opt-in, through a postgresql+psycopg:// URL or DB_DRIVER=psycopg
+    if os.environ.get("DB_DRIVER") == "psycopg" and database_url.startswith("postgresql://"):
+        database_url = database_url.replace("postgresql://", "postgresql+psycopg://", 1)
+    use_psycopg3 = database_url.startswith("postgresql+psycopg://")
+    
     # Set default parameters if not provided
-    engine_kwargs = {
-        "pool_pre_ping": True,  # Verify connections before use
-        "pool_size": 5,         # Number of connections to keep open
-        "max_overflow": 10,     # Max number of connections above pool_size
-        "pool_timeout": 30,     # Seconds to wait for a connection
-        "pool_recycle": 1800,   # Recycle connections after 30 minutes
-        "echo": False           # Don't log all SQL
-    }
+    connect_args = {}
+    if _use_null_pool():
+        # No idle pooled connections holding backend slots, e.g. behind pgbouncer
+        engine_kwargs = {
+            "poolclass": NullPool,
+            "echo": False
+        }
+    else:
+        engine_kwargs = {
+            "pool_pre_ping": True,  # Verify connections before use
+            "pool_size": 5,         # Number of connections to keep open
+            "max_overflow": 10,     # Max number of connections above pool_size
+            "pool_timeout": 30,     # Seconds to wait for a connection
+            "pool_recycle": 1800,   # Recycle connections after 30 minutes
+            "echo": False           # Don't log all SQL
+        }
+    
+    # The caller's connect_args are merged into the computed ones, with their
+    # options last so a setting they pass wins over ours. A statement_timeout
+    # of their own replaces the default one, which then must not be recorded.
+    user_connect_args = dict(kwargs.pop("connect_args", None) or {})
+    user_options = user_connect_args.pop("options", None)
+    if user_options and "statement_timeout" in user_options:
+        statement_timeout_ms = None
+    
+    options = []
+    if _async_commit():
+        # Test databases only: no fsync per commit since the data is disposable
+        options.append("-c synchronous_commit=off")
+    if statement_timeout_ms is not None:
+        options.append(f"-c statement_timeout={int(statement_timeout_ms)}")
+    if user_options:
+        options.append(user_options)
+    if options:
+        connect_args["options"] = " ".join(options)
+    
+    if use_psycopg3:
+        # Most statements run once, so skip server-side prepared statements
+        connect_args["prepare_threshold"] = None
+    connect_args.update(user_connect_args)
+    
+    if connect_args:
+        engine_kwargs["connect_args"] = connect_args
     
     # Update with user-provided parameters
     engine_kwargs.update(kwargs)
@@ -105,30 +192,79 @@ def get_engine(database_url: Optional[str] = None, **kwargs) -> Engine:
     # Create and return engine
     try:
         engine = create_engine(database_url, **engine_kwargs)
+        if statement_timeout_ms is not None:
+            # Let with_timeout know connections already start with this timeout
+            register_statement_timeout(engine, statement_timeout_ms, apply=False)
         logger.info(f"Database engine created with connection pooling for {database_url.split('@')[-1]}")
         return engine
     except SQLAlchemyError as e:
         logger.error(f"Failed to create database engine: {e}")
         raise
     
-def check_connection(engine: Engine) -> bool:
+def get_cached_engine(database_url: Optional[str] = None) -> Engine:
+    """
+    Get a process-wide engine for a database URL, creating it on first use.
+    
+    Engines are factories meant to be created once; callers that would
+    otherwise call get_engine repeatedly (e.g. per test) share one engine
+    and its connection pool instead.
+    
+    Args:
+        database_url: Database connection URL, defaults to environment variable
+    
+    Returns:
+        Engine: Shared SQLAlchemy engine instance
+    """
+    if database_url is None:
+        database_url = get_database_url()
+    
+    with _CACHED_ENGINES_LOCK:
+        engine = _CACHED_ENGINES.get(database_url)
+        if engine is None:
+            engine = _CACHED_ENGINES[database_url] = get_engine(database_url)
+        return engine
+
+
+def clear_engine_cache() -> None:
+    """
+    Dispose of and forget all engines created by get_cached_engine.
+    """
+    with _CACHED_ENGINES_LOCK:
+        engines = list(_CACHED_ENGINES.values())
+        _CACHED_ENGINES.clear()
+    
+    for engine in engines:
+        engine.dispose()
+
+
+def check_connection(engine: Engine, max_age: float = 0.0) -> bool:
     """
     Test the database connection.
     
     Args:
         engine: SQLAlchemy engine instance
+        max_age: Seconds a successful test stays valid; within that window
+            the result is reused without checking out a connection, which
+            keeps frequent liveness probes off the pool
     
     Returns:
         bool: True if connection successful, False otherwise
     """
+    now = time.monotonic()
+    last_ok = _LAST_CONNECTION_OK.get(engine)
+    if last_ok is not None and now - last_ok < max_age:
+        return True
+    
     try:
         # Execute a simple query to test connection
         with engine.connect() as conn:
             conn.execute(text("SELECT 1"))
         logger.info("Database connection test successful")
+        _LAST_CONNECTION_OK[engine] = now
         return True
     except SQLAlchemyError as e:
         logger.error(f"Database connection test failed: {e}")
+        _LAST_CONNECTION_OK.pop(engine, None)
         return False
 
 
@@ -187,9 +323,50 @@ def get_session_factory(engine: Optional[Engine] = None) -> sessionmaker:
     return session_factory
 
 
-# Create default engine and session factory
-default_engine = get_engine()
-SessionFactory = get_session_factory(default_engine)
+def _get_default_engine() -> Engine:
+    """
+    Get the default engine, creating it on first use.
+    
+    Returns:
+        Engine: Shared default SQLAlchemy engine
+    """
+    engine = globals().get("default_engine")
+    if engine is None:
+        engine = get_engine()
+        globals()["default_engine"] = engine
+    return engine
+
+
+def _get_default_session_factory() -> sessionmaker:
+    """
+    Get the default session factory, creating it on first use.
+    
+    Returns:
+        sessionmaker: Shared session factory bound to the default engine
+    """
+    session_factory = globals().get("SessionFactory")
+    if session_factory is None:
+        session_factory = get_session_factory(_get_default_engine())
+        globals()["SessionFactory"] = session_factory
+    return session_factory
+
+
+def __getattr__(name: str) -> Any:
+    """
+    Create the default engine and session factory lazily (PEP 562), so that
+    importing this module does not set up a database engine.
+    
+    Args:
+        name: Module attribute being accessed
+    
+    Returns:
+        Any: The requested default engine or session factory
+    """
+    if name == "default_engine":
+        return _get_default_engine()
+    if name == "SessionFactory":
+        return _get_default_session_factory()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_db_session() -> Session:
@@ -199,7 +376,7 @@ def get_db_session() -> Session:
     Returns:
         Session: SQLAlchemy database session
     """
-    return SessionFactory()
+    return _get_default_session_factory()()
 
 class DatabaseSession:
     """
@@ -217,7 +394,7 @@ class DatabaseSession:
             session_factory: Session factory to use, defaults to global SessionFactory
         """
         if session_factory is None:
-            session_factory = SessionFactory
+            session_factory = _get_default_session_factory()
         self.session_factory = session_factory
         self.session = None
     
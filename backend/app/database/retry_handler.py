@@ -4,14 +4,18 @@ Retry logic for database operations.
 Implements timeout and retry mechanisms for database connections and operations.
 """
 
+import functools
 import logging
+import random
 import threading
 import time
+import weakref
 from functools import wraps
-from typing import Any, Callable, Type, TypeVar, cast
+from typing import Any, Callable, Optional, Type, TypeVar, cast
 
 import sqlalchemy.exc
-from sqlalchemy import text
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
 from sqlalchemy.orm import Session
 
 logger = logging.getLogger(__name__)
@@ -24,19 +28,47 @@ DEFAULT_RETRY_DELAY = 0.5  # Initial delay in seconds
 DEFAULT_MAX_DELAY = 5  # Maximum delay in seconds
 DEFAULT_BACKOFF_FACTOR = 2  # Exponential backoff multiplier
 DEFAULT_TIMEOUT = 10  # Default operation timeout in seconds
+DEFAULT_JITTER = "full"  # Randomize delays so concurrent callers don't retry in lockstep
+
+# Key in the pooled connection's info dict holding its default statement timeout
+STATEMENT_TIMEOUT_INFO_KEY = "statement_timeout_ms"
+# Connection.info key for a weak reference to the transaction that last ran
+# SET LOCAL, and the timeout it set
+_LOCAL_TIMEOUT_INFO_KEY = "local_statement_timeout"
+
+# Default circuit breaker parameters
+DEFAULT_FAILURE_THRESHOLD = 5  # Consecutive failures before the circuit opens
+DEFAULT_RESET_TIMEOUT = 60  # Seconds before an open circuit allows a trial call
+DEFAULT_HALF_OPEN_SUCCESSES = 3  # Successful trial calls needed to close again
+
+# Supported ways of randomizing the backoff delay
+JITTER_MODES = ("none", "full", "equal", "decorrelated")
 
 # Define retriable exceptions
 RETRIABLE_EXCEPTIONS = (
     sqlalchemy.exc.OperationalError,  # Connection issues, deadlocks
-    sqlalchemy.exc.IntegrityError,  # Constraint violations
     sqlalchemy.exc.DBAPIError,  # Database API errors
 )
 
 NON_RETRIABLE_EXCEPTIONS = (
     sqlalchemy.exc.ProgrammingError,  # SQL syntax errors
     sqlalchemy.exc.DataError,  # Invalid data format
+    sqlalchemy.exc.IntegrityError,  # Constraint violations
 )
 
+# SQLSTATE codes of transient failures. A retriable exception that carries
+# any other code (e.g. a division by zero) fails deterministically and is
+# raised at once; exceptions without a code are still retried.
+RETRIABLE_SQLSTATES = frozenset({
+    "08000", "08001", "08003", "08004", "08006",  # Connection exceptions
+    "40001",  # Serialization failure
+    "40P01",  # Deadlock detected
+    "53300",  # Too many connections
+    "55P03",  # Lock not available
+    "57014",  # Query canceled, e.g. by statement_timeout
+    "57P01", "57P02", "57P03",  # Server shutting down or not accepting connections yet
+})
+
 
 class DatabaseTimeoutError(Exception):
     """Exception raised when a database operation times out."""
@@ -48,6 +80,336 @@ class MaxRetriesExceededError(Exception):
     pass
 
 
+class CircuitOpenError(DatabaseTimeoutError):
+    """Raised without calling the database while its circuit breaker is open."""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures of a database operation and stops calling it
+    for a while once too many failed in a row.
+    
+    The breaker starts CLOSED. After failure_threshold consecutive failures it
+    becomes OPEN and rejects calls. Once reset_timeout seconds have passed it
+    becomes HALF_OPEN and lets calls through again; it closes after
+    half_open_successes_needed successes, and reopens on the next failure.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        half_open_successes_needed: int = DEFAULT_HALF_OPEN_SUCCESSES
+    ):
+        """
+        Initialize a closed circuit breaker.
+        
+        Args:
+            failure_threshold: Consecutive failures before the circuit opens
+            reset_timeout: Seconds to wait before allowing trial calls
+            half_open_successes_needed: Successful trial calls needed to close
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_successes_needed = half_open_successes_needed
+        self.state = self.CLOSED
+        self.failure_count = 0
+        self.success_count = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """
+        Check whether a call may proceed.
+        
+        Returns:
+            False while the circuit is open, True otherwise
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self.success_count = 0
+            return True
+    
+    def record_success(self) -> None:
+        """Record a successful call."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.success_count += 1
+                if self.success_count < self.half_open_successes_needed:
+                    return
+                self.state = self.CLOSED
+            self.failure_count = 0
+    
+    def record_failure(self) -> None:
+        """Record a failed call, opening the circuit if needed."""
+        with self._lock:
+            self.failure_count += 1
+            if self.state == self.HALF_OPEN or self.failure_count >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Opening circuit breaker after {self.failure_count} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+# Per-thread generators, so concurrent retries don't share the lock of the
+# module-level random functions
+_thread_local = threading.local()
+
+
+def _random() -> random.Random:
+    """
+    Get this thread's random number generator, creating it on first use.
+
+    Returns:
+        random.Random instance owned by the calling thread
+    """
+    rng = getattr(_thread_local, "rng", None)
+    if rng is None:
+        rng = _thread_local.rng = random.Random()
+    return rng
+
+
+def _backoff_delay(
+    jitter: str,
+    attempt: int,
+    previous_delay: float,
+    initial_delay: float,
+    max_delay: float,
+    backoff_factor: float
+) -> float:
+    """
+    Compute how long to sleep before the next retry.
+
+    Args:
+        jitter: One of JITTER_MODES
+        attempt: Zero-based number of the attempt that just failed
+        previous_delay: Delay used before the previous retry
+        initial_delay: Initial delay between retries in seconds
+        max_delay: Maximum delay between retries in seconds
+        backoff_factor: Factor by which the delay increases
+
+    Returns:
+        Delay in seconds
+    """
+    capped = min(initial_delay * (backoff_factor ** attempt), max_delay)
+    if jitter == "none":
+        return capped
+    rng = _random()
+    if jitter == "full":
+        return rng.uniform(0, capped)
+    if jitter == "equal":
+        return capped / 2 + rng.uniform(0, capped / 2)
+    # Decorrelated: grow from the previous delay rather than the attempt number
+    return min(max_delay, rng.uniform(initial_delay, previous_delay * 3))
+
+
+@functools.lru_cache(maxsize=256)
+def _classify(exception_type: type, retriable: tuple, non_retriable: tuple) -> str:
+    """
+    Classify an exception type for retrying, cached per type and configuration.
+
+    Args:
+        exception_type: Type of the raised exception
+        retriable: Tuple of exceptions that should trigger a retry
+        non_retriable: Tuple of exceptions that should never be retried
+
+    Returns:
+        "noretry", "retry" or "unknown"
+    """
+    if issubclass(exception_type, non_retriable):
+        return "noretry"
+    if issubclass(exception_type, retriable):
+        return "retry"
+    return "unknown"
+
+
+def _sqlstate(exception: BaseException) -> Optional[str]:
+    """
+    Get the SQLSTATE code reported by the driver for an exception.
+
+    Args:
+        exception: Raised exception, usually a sqlalchemy.exc.DBAPIError
+
+    Returns:
+        Five character SQLSTATE code, or None if the driver gave none
+    """
+    orig = getattr(exception, "orig", None)
+    # psycopg2 calls it pgcode, psycopg 3 calls it sqlstate
+    return getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+
+
+def _set_session_timeout(args: tuple, timeout_ms: int) -> None:
+    """
+    Apply a statement timeout if the first argument is a Session or Connection.
+    
+    No SET is issued when this transaction already set the timeout, or when
+    the transaction has no SET LOCAL of its own and the connection already
+    defaults to the timeout (see register_statement_timeout). SET LOCAL ends
+    with the transaction, so it never leaks into later users of the pooled
+    connection.
+
+    Args:
+        args: Positional arguments of the decorated call
+        timeout_ms: Statement timeout in milliseconds
+    """
+    if not args:
+        return
+    if isinstance(args[0], Session):
+        connection = args[0].connection()
+    elif isinstance(args[0], Connection):
+        connection = args[0]
+    else:
+        return
+    
+    info = connection.info
+    transaction = connection.get_transaction()
+    local = info.get(_LOCAL_TIMEOUT_INFO_KEY)
+    if transaction is not None and local is not None and local[0]() is transaction:
+        # This transaction already ran a SET LOCAL, which overrides the default
+        if local[1] == timeout_ms:
+            return
+    elif info.get(STATEMENT_TIMEOUT_INFO_KEY) == timeout_ms:
+        return
+    
+    # Literal SQL without parameters, so skip statement compilation
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
+    # A weak reference, so the pool record does not keep the transaction alive
+    info[_LOCAL_TIMEOUT_INFO_KEY] = (weakref.ref(connection.get_transaction()), timeout_ms)
+
+
+def _run_db_operation(
+    func: Callable[..., Any],
+    args: tuple,
+    kwargs: dict,
+    retry: bool,
+    max_retries: int,
+    initial_delay: float,
+    max_delay: float,
+    backoff_factor: float,
+    jitter: str,
+    retriable_exceptions: tuple,
+    non_retriable_exceptions: tuple,
+    timeout: Optional[float],
+    sleep: Optional[Callable[[float], None]] = None,
+) -> Any:
+    """
+    Call a database operation with optional retries and timeout in one frame.
+    
+    Shared by retry_database_operation, with_timeout and safe_db_operation, so
+    stacking retry and timeout handling costs a single wrapper call.
+
+    Args:
+        func: Database operation to call
+        args: Positional arguments for func
+        kwargs: Keyword arguments for func
+        retry: Whether to classify exceptions and retry
+        max_retries: Maximum number of retry attempts
+        initial_delay: Initial delay between retries in seconds
+        max_delay: Maximum delay between retries in seconds
+        backoff_factor: Factor by which the delay increases
+        jitter: How to randomize delays, one of JITTER_MODES
+        retriable_exceptions: Tuple of exceptions that should trigger a retry
+        non_retriable_exceptions: Tuple of exceptions that should never be retried
+        timeout: Total time budget in seconds, or None for no timeout
+        sleep: Function used to wait between retries, time.sleep if None
+
+    Returns:
+        Result of func
+    """
+    if timeout is not None:
+        timeout_ms = int(timeout * 1000)
+        # Monotonic time is not affected by wall clock adjustments
+        deadline = time.monotonic() + timeout
+    
+    last_exception = None
+    delay = initial_delay
+    attempts = max_retries + 1 if retry else 1
+
+    # Try the operation with retries
+    for attempt in range(attempts):
+        try:
+            if timeout is not None:
+                _set_session_timeout(args, timeout_ms)
+            return func(*args, **kwargs)
+        except Exception as e:
+            if timeout is not None:
+                if "timeout" in str(e).lower():
+                    # A PostgreSQL statement timeout passes through unchanged
+                    logger.warning(f"Database statement timeout detected: {str(e)}")
+                elif time.monotonic() > deadline:
+                    logger.warning(f"Database operation timed out after {timeout} seconds")
+                    raise DatabaseTimeoutError(
+                        f"Database operation timed out after {timeout} seconds"
+                    ) from e
+            
+            if not retry:
+                raise
+            
+            kind = _classify(type(e), retriable_exceptions, non_retriable_exceptions)
+            
+            # First check if this is a non-retriable exception
+            if kind == "noretry":
+                logger.error(f"Non-retriable database error: {str(e)}")
+                raise
+            
+            # Then check if this is a retriable exception
+            if kind != "retry":
+                # For exceptions that are neither retriable nor non-retriable, re-raise
+                logger.error(f"Unexpected database error: {str(e)}")
+                raise
+            
+            sqlstate = _sqlstate(e)
+            if sqlstate is not None and sqlstate not in RETRIABLE_SQLSTATES:
+                # The same statement would fail the same way again
+                logger.error(f"Non-transient database error (SQLSTATE {sqlstate}): {str(e)}")
+                raise
+            
+            # If we get here, this is a retriable exception
+            last_exception = e
+            
+            # Don't sleep on the last attempt
+            if attempt < max_retries:
+                delay = _backoff_delay(
+                    jitter, attempt, delay, initial_delay, max_delay, backoff_factor
+                )
+                
+                # Don't let the backoff sleep run past the time budget
+                if timeout is not None and time.monotonic() + delay > deadline:
+                    logger.warning(f"Database operation timed out after {timeout} seconds")
+                    raise DatabaseTimeoutError(
+                        f"Database operation timed out after {timeout} seconds"
+                    ) from e
+                
+                # Log the retry attempt
+                logger.warning(
+                    f"Database operation failed (attempt {attempt+1}/{max_retries+1}): {str(e)}. "
+                    f"Retrying in {delay:.2f} seconds..."
+                )
+                
+                # Sleep with exponential backoff
+                (sleep or time.sleep)(delay)
+            else:
+                # Log the final failure
+                logger.error(
+                    f"Database operation failed after {max_retries+1} attempts: {str(e)}"
+                )
+
+    # If we've exhausted all retries, raise the last exception
+    if last_exception:
+        raise MaxRetriesExceededError(f"Maximum retries exceeded: {str(last_exception)}") from last_exception
+    
+    # This shouldn't happen, but just in case
+    raise RuntimeError("Unexpected error in retry logic")
+
+
 def retry_database_operation(
     max_retries: int = DEFAULT_MAX_RETRIES,
     initial_delay: float = DEFAULT_RETRY_DELAY,
@@ -55,6 +417,8 @@ def retry_database_operation(
     backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
     retriable_exceptions: tuple = RETRIABLE_EXCEPTIONS,
     non_retriable_exceptions: tuple = NON_RETRIABLE_EXCEPTIONS,
+    jitter: str = DEFAULT_JITTER,
+    sleep: Optional[Callable[[float], None]] = None,
 ) -> Callable[[F], F]:
     """
     Decorator to retry database operations with exponential backoff.
@@ -66,64 +430,65 @@ def retry_database_operation(
         backoff_factor: Factor by which the delay increases
         retriable_exceptions: Tuple of exceptions that should trigger a retry
         non_retriable_exceptions: Tuple of exceptions that should never be retried
+        jitter: How to randomize delays: "none", "full", "equal" or "decorrelated"
+        sleep: Function used to wait between retries, time.sleep if None
 
     Returns:
         Decorated function with retry logic
     """
+    if jitter not in JITTER_MODES:
+        raise ValueError(f"Unknown jitter mode: {jitter}")
+
     def decorator(func: F) -> F:
         @wraps(func)
         def wrapper(*args: Any, **kwargs: Any) -> Any:
-            last_exception = None
-            delay = initial_delay
-
-            # Try the operation with retries
-            for attempt in range(max_retries + 1):
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    # First check if this is a non-retriable exception
-                    if isinstance(e, non_retriable_exceptions):
-                        logger.error(f"Non-retriable database error: {str(e)}")
-                        raise
-                    
-                    # Then check if this is a retriable exception
-                    if not isinstance(e, retriable_exceptions):
-                        # For exceptions that are neither retriable nor non-retriable, re-raise
-                        logger.error(f"Unexpected database error: {str(e)}")
-                        raise
-                    
-                    # If we get here, this is a retriable exception
-                    last_exception = e
-                    
-                    # Don't sleep on the last attempt
-                    if attempt < max_retries:
-                        # Log the retry attempt
-                        logger.warning(
-                            f"Database operation failed (attempt {attempt+1}/{max_retries+1}): {str(e)}. "
-                            f"Retrying in {delay:.2f} seconds..."
-                        )
-                        
-                        # Sleep with exponential backoff
-                        time.sleep(delay)
-                        
-                        # Increase delay for next attempt, but not beyond max_delay
-                        delay = min(delay * backoff_factor, max_delay)
-                    else:
-                        # Log the final failure
-                        logger.error(
-                            f"Database operation failed after {max_retries+1} attempts: {str(e)}"
-                        )
-
-            # If we've exhausted all retries, raise the last exception
-            if last_exception:
-                raise MaxRetriesExceededError(f"Maximum retries exceeded: {str(last_exception)}") from last_exception
-            
-            # This shouldn't happen, but just in case
-            raise RuntimeError("Unexpected error in retry logic")
+            return _run_db_operation(
+                func, args, kwargs,
+                retry=True,
+                max_retries=max_retries,
+                initial_delay=initial_delay,
+                max_delay=max_delay,
+                backoff_factor=backoff_factor,
+                jitter=jitter,
+                retriable_exceptions=retriable_exceptions,
+                non_retriable_exceptions=non_retriable_exceptions,
+                timeout=None,
+                sleep=sleep,
+            )
             
         return cast(F, wrapper)
     return decorator
 
+
+def register_statement_timeout(engine: Engine, timeout_ms: int, apply: bool = True) -> None:
+    """
+    Set a default statement_timeout on every new connection of an engine.
+    
+    with_timeout skips its per-call SET when the requested timeout matches
+    this default.
+
+    Args:
+        engine: SQLAlchemy engine whose connections should get the timeout
+        timeout_ms: Statement timeout in milliseconds
+        apply: Whether to run SET on each new connection; pass False when the
+            connections already start with the timeout, e.g. from libpq options
+    """
+    timeout_ms = int(timeout_ms)
+    
+    def set_statement_timeout(dbapi_connection: Any, connection_record: Any) -> None:
+        if not apply:
+            connection_record.info[STATEMENT_TIMEOUT_INFO_KEY] = timeout_ms
+            return
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"SET statement_timeout = {timeout_ms}")
+        cursor.close()
+        # Commit so the pool's reset-on-return rollback doesn't undo the SET
+        dbapi_connection.commit()
+        connection_record.info[STATEMENT_TIMEOUT_INFO_KEY] = timeout_ms
+    
+    event.listen(engine, "connect", set_statement_timeout)
+
+
 def with_timeout(timeout: float = DEFAULT_TIMEOUT) -> Callable[[F], F]:
     """
     Decorator to add timeout to database operations using SQLAlchemy sessions.
@@ -137,32 +502,18 @@ def with_timeout(timeout: float = DEFAULT_TIMEOUT) -> Callable[[F], F]:
     def decorator(func: F) -> F:
         @wraps(func)
         def wrapper(*args: Any, **kwargs: Any) -> Any:
-            start_time = time.time()
-            
-            # Set timeout if the first argument is a Session
-            if args and isinstance(args[0], Session):
-                session = args[0]
-                # Set statement timeout in milliseconds
-                timeout_ms = int(timeout * 1000)
-                session.execute(text(f"SET statement_timeout = {timeout_ms}"))
-            
-            try:
-                return func(*args, **kwargs)
-            except Exception as e:
-                # If this is a PostgreSQL timeout error, let it pass through
-                if "timeout" in str(e).lower():
-                    logger.warning(f"Database statement timeout detected: {str(e)}")
-                    raise
-                    
-                # For other exceptions, check if we also timed out
-                if time.time() - start_time > timeout:
-                    logger.warning(f"Database operation timed out after {timeout} seconds")
-                    raise DatabaseTimeoutError(
-                        f"Database operation timed out after {timeout} seconds"
-                    ) from e
-                    
-                # Otherwise, just re-raise the original exception
-                raise
+            return _run_db_operation(
+                func, args, kwargs,
+                retry=False,
+                max_retries=0,
+                initial_delay=0,
+                max_delay=0,
+                backoff_factor=1,
+                jitter="none",
+                retriable_exceptions=(),
+                non_retriable_exceptions=(),
+                timeout=timeout,
+            )
             
         return cast(F, wrapper)
     return decorator
@@ -173,10 +524,20 @@ def safe_db_operation(
     timeout: float = DEFAULT_TIMEOUT,
     initial_delay: float = DEFAULT_RETRY_DELAY,
     max_delay: float = DEFAULT_MAX_DELAY,
-    backoff_factor: float = DEFAULT_BACKOFF_FACTOR
+    backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+    jitter: str = DEFAULT_JITTER,
+    sleep: Optional[Callable[[float], None]] = None,
+    circuit_breaker: Optional[CircuitBreaker] = None
 ) -> Callable[[F], F]:
     """
     Combined decorator to add both retry and timeout logic to database operations.
+    
+    The timeout is a budget for the whole call, including retries and the
+    sleeps between them.
+    
+    With a circuit_breaker, calls fail fast with CircuitOpenError after
+    repeated failures, instead of each call sleeping through the whole retry
+    schedule. Only the operations given the same breaker share its state.
 
     Args:
         max_retries: Maximum number of retry attempts
@@ -184,19 +545,50 @@ def safe_db_operation(
         initial_delay: Initial delay between retries in seconds
         max_delay: Maximum delay between retries in seconds
         backoff_factor: Factor by which the delay increases
+        jitter: How to randomize delays: "none", "full", "equal" or "decorrelated"
+        sleep: Function used to wait between retries, time.sleep if None
+        circuit_breaker: Breaker guarding the operation, none if None
 
     Returns:
         Decorated function with retry and timeout logic
     """
+    if jitter not in JITTER_MODES:
+        raise ValueError(f"Unknown jitter mode: {jitter}")
+
     def decorator(func: F) -> F:
-        # Apply both decorators
-        timed_func = with_timeout(timeout)(func)
-        retried_func = retry_database_operation(
-            max_retries=max_retries,
-            initial_delay=initial_delay,
-            max_delay=max_delay,
-            backoff_factor=backoff_factor
-        )(timed_func)
-        return cast(F, retried_func)
-    
-    return decorator
\ No newline at end of file
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if circuit_breaker is not None and not circuit_breaker.allow():
+                raise CircuitOpenError(
+                    f"Circuit breaker open for {getattr(func, '__qualname__', func)}"
+                )
+            
+            try:
+                result = _run_db_operation(
+                    func, args, kwargs,
+                    retry=True,
+                    max_retries=max_retries,
+                    initial_delay=initial_delay,
+                    max_delay=max_delay,
+                    backoff_factor=backoff_factor,
+                    jitter=jitter,
+                    retriable_exceptions=RETRIABLE_EXCEPTIONS,
+                    non_retriable_exceptions=NON_RETRIABLE_EXCEPTIONS,
+                    timeout=timeout,
+                    sleep=sleep,
+                )
+            except CircuitOpenError:
+                # A nested operation failing fast is not a failure of this one
+                raise
+            except (MaxRetriesExceededError, DatabaseTimeoutError):
+                if circuit_breaker is not None:
+                    circuit_breaker.record_failure()
+                raise
+            
+            if circuit_breaker is not None:
+                circuit_breaker.record_success()
+            return result
+        
+        return cast(F, wrapper)
+    
+    return decorator
@@ -7,63 +7,263 @@ based on foreign key constraints.
 
 Part of the implementation for ENV-DB-2.4.3.1 (Create table dependency map)
 """
-from typing import Dict, List, Set, Tuple, Optional
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, FrozenSet, List, Set, Tuple, Optional
+import functools
+import graphlib
 import logging
-from sqlalchemy import inspect, MetaData, Table
+import sys
+import weakref
+from sqlalchemy import inspect, MetaData
 from sqlalchemy.engine import Engine
 from sqlalchemy.sql import text
 
 logger = logging.getLogger(__name__)
 
+# Latest (schema signature, dependency map) per engine, without keeping the
+# engine alive
+_DEPENDENCY_MAP_CACHE: "weakref.WeakKeyDictionary[Engine, Tuple[str, TableDependencyMap]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+# Fingerprint of the current schema's tables, foreign keys and partitions.
+# Hashing the sorted names catches renames, attached or detached partitions
+# and dropped and recreated constraints, not just changes in object counts.
+SCHEMA_SIGNATURE_SQL = text(
+    "SELECT md5("
+    "coalesce((SELECT string_agg(relname || ':' || relkind, ',' ORDER BY relname) "
+    "FROM pg_class WHERE relkind IN ('r', 'p') "
+    "AND relnamespace = to_regnamespace(quote_ident(current_schema()))), '') || '/' || "
+    "coalesce((SELECT string_agg(edge, ',' ORDER BY edge) FROM ("
+    "SELECT conrelid::regclass::text || '>' || confrelid::regclass::text AS edge "
+    "FROM pg_constraint WHERE contype = 'f' "
+    "AND connamespace = to_regnamespace(quote_ident(current_schema()))) fks), '') || '/' || "
+    "coalesce((SELECT string_agg(edge, ',' ORDER BY edge) FROM ("
+    "SELECT inhrelid::regclass::text || '<' || inhparent::regclass::text AS edge "
+    "FROM pg_inherits JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+    "WHERE parent.relnamespace = to_regnamespace(quote_ident(current_schema()))) parts), ''))"
+)
+
+# Tables in the current schema, matching Inspector.get_table_names()
+TABLE_NAMES_SQL = text(
+    "SELECT relname FROM pg_class "
+    "WHERE relkind IN ('r', 'p') "
+    "AND relnamespace = to_regnamespace(quote_ident(current_schema())) "
+    "ORDER BY relname"
+)
+
+# Every foreign key edge between tables of the current schema
+FOREIGN_KEY_EDGES_SQL = text(
+    "SELECT child.relname, parent.relname FROM pg_constraint "
+    "JOIN pg_class child ON child.oid = pg_constraint.conrelid "
+    "JOIN pg_class parent ON parent.oid = pg_constraint.confrelid "
+    "WHERE pg_constraint.contype = 'f' "
+    "AND child.relnamespace = to_regnamespace(quote_ident(current_schema())) "
+    "AND parent.relnamespace = to_regnamespace(quote_ident(current_schema()))"
+)
+
+# Direct parent of every partition in the current schema
+PARTITION_PARENTS_SQL = text(
+    "SELECT child.relname, parent.relname FROM pg_inherits "
+    "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+    "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+    "WHERE parent.relkind = 'p' "
+    "AND parent.relnamespace = to_regnamespace(quote_ident(current_schema()))"
+)
+
+def quote_table_name(table: str) -> str:
+    """
+    Quote a table name as an SQL identifier, doubling any embedded quotes.
+    
+    Args:
+        table: Unquoted table name
+        
+    Returns:
+        Quoted identifier, safe to splice into a statement
+    """
+    return '"' + table.replace('"', '""') + '"'
+
+
+def truncate_statement(tables: List[str]):
+    """
+    Build a single TRUNCATE for a set of tables, restarting their sequences.
+    
+    Args:
+        tables: Table names to truncate
+        
+    Returns:
+        TRUNCATE ... RESTART IDENTITY CASCADE statement
+    """
+    table_list = ", ".join(quote_table_name(table) for table in tables)
+    return text(f"TRUNCATE TABLE {table_list} RESTART IDENTITY CASCADE")
+
+
 class TableDependencyMap:
     """
     Builds and manages a dependency graph for database tables.
     Used to determine the proper order for truncating tables.
     """
     
-    def __init__(self, engine: Engine, inspector=None):
+    def __init__(
+        self,
+        engine: Optional[Engine],
+        inspector=None,
+        metadata: Optional[MetaData] = None,
+        parallel_reflection: int = 0
+    ):
         """
         Initialize the dependency map with a SQLAlchemy engine.
         
         Args:
             engine: SQLAlchemy engine connected to the database
+            inspector: Inspector to reflect the schema with, kept for reuse
+            metadata: Already reflected MetaData to read the schema from
+                instead of querying the database
+            parallel_reflection: Number of threads for reflecting foreign keys
+                when they have to be fetched table by table (0 to disable)
         """
-        self.engine = engine
+        self._engine = engine
         self.dependencies: Dict[str, Set[str]] = {}
         self.reverse_dependencies: Dict[str, Set[str]] = {}
         self.tables: List[str] = []
+        self.partition_parents: Dict[str, str] = {}
+        self._all_descendants: Optional[Dict[str, FrozenSet[str]]] = None
+        self._truncation_order: Optional[List[str]] = None
+        self._circular_dependencies: Optional[FrozenSet[Tuple[str, str]]] = None
+        self._dependency_arrays: Optional[Tuple[array, array]] = None
         self._inspector = inspector
+        self._metadata = metadata
+        self._parallel_reflection = parallel_reflection
         self._build_dependencies()
     
+    @property
+    def engine(self) -> Optional[Engine]:
+        """Engine the map was built from, or None once a weakly held one is gone."""
+        if isinstance(self._engine, weakref.ref):
+            return self._engine()
+        return self._engine
+    
+    @engine.setter
+    def engine(self, engine: Optional[Engine]) -> None:
+        self._engine = engine
+    
+    def _hold_engine_weakly(self) -> None:
+        """Keep only a weak reference to the engine, e.g. while cached."""
+        if self._engine is not None and not isinstance(self._engine, weakref.ref):
+            self._engine = weakref.ref(self._engine)
+    
     def _build_dependencies(self) -> None:
         """
         Build the dependency graph by querying the database schema.
         """
-        # Get all tables in the database
-        if self._inspector is None:
-            inspector = inspect(self.engine)
+        if self._metadata is not None:
+            # Read everything from the already reflected tables
+            self.tables = sorted(str(table.name) for table in self._metadata.tables.values())
+            foreign_key_edges = [
+                (str(table.name), str(fk.column.table.name))
+                for table in self._metadata.tables.values()
+                for fk in table.foreign_keys
+            ]
+        elif self._inspector is None and self.engine.dialect.name == "postgresql":
+            # Read tables, foreign keys and partitions with one query each,
+            # instead of one reflection query per table
+            with self.engine.connect() as conn:
+                self.tables = list(conn.execute(TABLE_NAMES_SQL).scalars())
+                foreign_key_edges = conn.execute(FOREIGN_KEY_EDGES_SQL).all()
+                self.partition_parents = dict(conn.execute(PARTITION_PARENTS_SQL).all())
         else:
+            # Keep the inspector so its reflection cache is reused
+            if self._inspector is None:
+                self._inspector = inspect(self.engine)
+                # Reflect every table's foreign keys in one bulk call
+                foreign_keys = {
+                    table: fks
+                    for (_, table), fks in self._inspector.get_multi_foreign_keys().items()
+                }
+            else:
+                foreign_keys = None
             inspector = self._inspector
-        self.tables = inspector.get_table_names()
+            
+            # Get all tables in the database
+            self.tables = inspector.get_table_names()
+            
+            if foreign_keys is None:
+                # Tables are independent, so slow per-table queries can overlap
+                if self._parallel_reflection > 0:
+                    with ThreadPoolExecutor(max_workers=self._parallel_reflection) as executor:
+                        table_fks = list(executor.map(inspector.get_foreign_keys, self.tables))
+                else:
+                    table_fks = [inspector.get_foreign_keys(table) for table in self.tables]
+                foreign_keys = dict(zip(self.tables, table_fks))
+            
+            # Query foreign key constraints
+            foreign_key_edges = [
+                (table, fk['referred_table'])
+                for table in self.tables
+                for fk in foreign_keys.get(table, [])
+            ]
+        
+        # Intern names so the many sets below share one string per table
+        self.tables = [sys.intern(table) for table in self.tables]
         
         # Initialize dependency dicts
         self.dependencies = {table: set() for table in self.tables}
         self.reverse_dependencies = {table: set() for table in self.tables}
         
-        # Query foreign key constraints
-        for table in self.tables:
-            foreign_keys = inspector.get_foreign_keys(table)
-            for fk in foreign_keys:
-                # Get the referenced table
-                referenced_table = fk['referred_table']
-                
-                # Add dependency: table depends on referenced_table
-                self.dependencies[table].add(referenced_table)
-                
-                # Add reverse dependency: referenced_table is depended on by table
-                self.reverse_dependencies[referenced_table].add(table)
+        for table, referenced_table in foreign_key_edges:
+            table, referenced_table = sys.intern(table), sys.intern(referenced_table)
+            
+            # Add dependency: table depends on referenced_table
+            self.dependencies[table].add(referenced_table)
+            
+            # Add reverse dependency: referenced_table is depended on by table
+            self.reverse_dependencies[referenced_table].add(table)
+        
+        # Freeze the graph; the cached results below rely on it not changing
+        self.dependencies = {table: frozenset(deps) for table, deps in self.dependencies.items()}
+        self.reverse_dependencies = {
+            table: frozenset(deps) for table, deps in self.reverse_dependencies.items()
+        }
+        
+        logger.debug("Built dependency map for %d tables", len(self.tables))
+    
+    @property
+    def partitioned_roots(self) -> Set[str]:
+        """
+        Partitioned tables that are not themselves partitions of another table.
+        
+        Returns:
+            Set of root partitioned table names
+        """
+        return {
+            parent for parent in self.partition_parents.values()
+            if parent not in self.partition_parents
+        }
+    
+    def exclude_partitions(self, tables: List[str]) -> List[str]:
+        """
+        Drop partitions whose partitioned ancestor is also in the list, since
+        TRUNCATE or DELETE on the ancestor already covers them.
+        
+        Args:
+            tables: Table names, in any order
+            
+        Returns:
+            The tables without covered partitions, in the same order
+        """
+        table_set = set(tables)
+        
+        def covered(table: str) -> bool:
+            parent = self.partition_parents.get(table)
+            while parent is not None:
+                if parent in table_set:
+                    return True
+                parent = self.partition_parents.get(parent)
+            return False
         
-        logger.debug(f"Built dependency map for {len(self.tables)} tables")
+        return [table for table in tables if not covered(table)]
     
     def get_truncation_order(self) -> List[str]:
         """
@@ -78,41 +278,122 @@ class TableDependencyMap:
             It delivers the list of recommended truncation targets as promised.
             The first table (left to right) should be dropped first.
         """
-        # Create a working copy of dependencies
-        remaining_deps = {table: set(deps) for table, deps in self.dependencies.items()}
+        if self._truncation_order is None:
+            self._truncation_order = self._compute_truncation_order()
+        # Return a copy so callers can't modify the cached order
+        return list(self._truncation_order)
+    
+    def _compute_truncation_order(self) -> List[str]:
+        """
+        Compute the truncation order, see get_truncation_order.
+        
+        Returns:
+            List of table names in the order they should be truncated
+        """
+        # A self-reference doesn't constrain the order, TRUNCATE handles it
+        graph = {
+            table: {dep for dep in deps if dep != table}
+            for table, deps in self.dependencies.items()
+        }
+        
+        try:
+            # Parents first; graphlib's sort is O(V+E)
+            ordered_tables = list(graphlib.TopologicalSorter(graph).static_order())
+        except graphlib.CycleError:
+            ordered_tables = self._order_with_cycles(graph)
+        
+        # Return in truncation order - parents first, then child
+        # This ensures foreign key constraints won't be violated
+        return list(reversed(ordered_tables))
+    
+    def _order_with_cycles(self, graph: Dict[str, Set[str]]) -> List[str]:
+        """
+        Order tables parents first, breaking dependency cycles.
+        
+        Args:
+            graph: Dependencies of each table, without self-references
+            
+        Returns:
+            List of table names, independent tables first
+        """
+        # Count unmet dependencies and index the dependents of each table
+        remaining_deps = {table: len(deps) for table, deps in graph.items()}
+        dependents: Dict[str, List[str]] = {table: [] for table in graph}
+        for table, deps in graph.items():
+            for dep in deps:
+                dependents[dep].append(table)
+        
+        ready = deque(table for table, count in remaining_deps.items() if count == 0)
         ordered_tables = []
         
         # Process tables until all are handled
         while remaining_deps:
-            # Find tables with no remaining dependencies
-            independent_tables = [
-                table for table, deps in remaining_deps.items() if not deps
-            ]
-            
-            if not independent_tables:
+            if not ready:
                 # Circular dependency detected
-                logger.error("Circular dependency detected among tables: %s", remaining_deps)
+                logger.error("Circular dependency detected among tables: %s", sorted(remaining_deps))
                 # Break the cycle by choosing a table with the fewest dependencies
-                min_deps = min(len(deps) for deps in remaining_deps.values() if deps)
-                independent_tables = [
-                    table for table, deps in remaining_deps.items() 
-                    if len(deps) == min_deps
-                ]
+                table = min(remaining_deps, key=remaining_deps.__getitem__)
                 logger.warning("Breaking cycle by selecting table with fewest dependencies: %s", 
-                              independent_tables[0])
+                              table)
+                ready.append(table)
             
-            # Add tables with no dependencies to the ordered list
-            for table in independent_tables:
-                ordered_tables.append(table)
-                remaining_deps.pop(table)
-                
-                # Remove this table from the dependencies of other tables
-                for deps in remaining_deps.values():
-                    deps.discard(table)
+            table = ready.popleft()
+            del remaining_deps[table]
+            ordered_tables.append(table)
+            
+            # Release the dependents that were only waiting on this table
+            for dependent in dependents[table]:
+                if dependent in remaining_deps:
+                    remaining_deps[dependent] -= 1
+                    if remaining_deps[dependent] == 0:
+                        ready.append(dependent)
         
-        # Return in truncation order - parents first, then child
-        # This ensures foreign key constraints won't be violated
-        return list(reversed(ordered_tables))
+        return ordered_tables
+    
+    def get_truncation_batches(self) -> List[List[str]]:
+        """
+        Group the truncation order into batches of mutually independent tables.
+        
+        Every table in a batch only references tables in later batches, so
+        each batch can be emptied by a single TRUNCATE statement.
+        
+        Returns:
+            List of batches, each a list of table names, in truncation order.
+            Schemas with dependency cycles come back as a single batch.
+        """
+        # Dependents must be truncated first, so they are the predecessors
+        graph = {
+            table: {dep for dep in deps if dep != table}
+            for table, deps in self.reverse_dependencies.items()
+        }
+        sorter = graphlib.TopologicalSorter(graph)
+        try:
+            sorter.prepare()
+        except graphlib.CycleError:
+            return [self.get_truncation_order()] if self.tables else []
+        
+        batches = []
+        while sorter.is_active():
+            batch = sorted(sorter.get_ready())
+            sorter.done(*batch)
+            batches.append(batch)
+        return batches
+    
+    def truncate_all(self, connection) -> None:
+        """
+        Empty every table and restart their identity sequences.
+        
+        A TRUNCATE naming all tables checks foreign keys against the whole
+        set at once, so the batches collapse into one statement.
+        
+        Args:
+            connection: SQLAlchemy connection to run the statement on
+        """
+        tables = self.exclude_partitions(self.get_truncation_order())
+        if not tables:
+            return
+        
+        connection.execute(truncate_statement(tables))
     
     def get_dependent_tables(self, table: str) -> Set[str]:
         """
@@ -124,23 +405,111 @@ class TableDependencyMap:
         Returns:
             Set of table names that depend on the specified table
         """
-        if table not in self.reverse_dependencies:
-            return set()
+        return set(self.all_descendants.get(table, frozenset()))
+    
+    @property
+    def all_descendants(self) -> Dict[str, FrozenSet[str]]:
+        """
+        Transitive closure of the reverse dependencies, computed on first use.
+        
+        Returns:
+            Dictionary mapping each table to every table that depends on it,
+            directly or indirectly
+        """
+        if self._all_descendants is None:
+            self._all_descendants = self._build_transitive_closure()
+        return self._all_descendants
+    
+    def _build_transitive_closure(self) -> Dict[str, FrozenSet[str]]:
+        """
+        Compute every table's transitive dependents in a single pass.
+        
+        Tables are visited dependents first, so each table's closure is the
+        union of its direct dependents and their already computed closures.
+        Schemas with dependency cycles fall back to a walk per table.
         
-        result = set()
-        to_process = list(self.reverse_dependencies[table])
+        Returns:
+            Dictionary mapping each table to all tables that depend on it
+        """
+        # Dependents must be visited first, so they are the predecessors
+        graph = {
+            table: {dep for dep in deps if dep != table}
+            for table, deps in self.reverse_dependencies.items()
+        }
+        try:
+            order = list(graphlib.TopologicalSorter(graph).static_order())
+        except graphlib.CycleError:
+            return {
+                table: frozenset(self._collect_dependent_tables(table))
+                for table in self.reverse_dependencies
+            }
+        
+        closure: Dict[str, FrozenSet[str]] = {}
+        for table in order:
+            direct = self.reverse_dependencies.get(table, frozenset())
+            closure[table] = functools.reduce(
+                frozenset.union,
+                (closure[dep] for dep in direct if dep != table),
+                frozenset(direct)
+            )
+        return closure
+    
+    def _collect_dependent_tables(self, table: str) -> Set[str]:
+        """
+        Walk the reverse dependencies of a table.
+        
+        Args:
+            table: The table name to start from
+            
+        Returns:
+            Set of table names that depend on the specified table
+        """
+        # Mark tables when queued so each one is queued only once
+        result = set(self.reverse_dependencies.get(table, ()))
+        to_process = deque(result)
         
         while to_process:
-            current = to_process.pop()
-            if current not in result:
-                result.add(current)
-                to_process.extend(
-                    dep for dep in self.reverse_dependencies.get(current, set())
-                    if dep not in result
-                )
+            current = to_process.popleft()
+            for dep in self.reverse_dependencies.get(current, ()):
+                if dep not in result:
+                    result.add(dep)
+                    to_process.append(dep)
         
         return result
     
+    def components(self) -> List[List[str]]:
+        """
+        Split the tables into groups that share no foreign keys with each other.
+        
+        Tables are grouped by weakly connected component of the FK graph, so
+        each group can be truncated independently of the others.
+        
+        Returns:
+            List of components, each a list of table names in truncation order
+        """
+        component_of: Dict[str, int] = {}
+        component_count = 0
+        for start_table in self.tables:
+            if start_table in component_of:
+                continue
+            
+            # Walk FK edges in both directions from this table
+            component_id = component_count
+            component_count += 1
+            to_process = [start_table]
+            while to_process:
+                current = to_process.pop()
+                if current in component_of:
+                    continue
+                component_of[current] = component_id
+                to_process.extend(self.dependencies.get(current, set()))
+                to_process.extend(self.reverse_dependencies.get(current, set()))
+        
+        components: Dict[int, List[str]] = {}
+        for table in self.get_truncation_order():
+            components.setdefault(component_of[table], []).append(table)
+        return list(components.values())
+    
     def generate_dependency_graph(self) -> Dict[str, Dict]:
         """
         Generate a dependency graph representation for visualization or reporting.
@@ -167,40 +536,72 @@ class TableDependencyMap:
         Returns:
             True if the order is valid, False otherwise
         """
+        position = {table: index for index, table in enumerate(order)}
+        
         # Ensure all tables are included
-        if set(order) != set(self.tables):
-            logger.error("The truncation order doesn't include all tables")
+        if len(order) != len(position) or position.keys() != self.dependencies.keys():
+            logger.error("The truncation order doesn't include every table exactly once")
             return False
         
-        # Detect circular dependencies
-        circular_deps = self._find_circular_dependencies()
-        logger.debug(f"Detected circular dependencies: {circular_deps}")
-        
-        # Create a set of processed tables
-        processed = set()
+        # Cycles are only looked up once a violation is found
+        circular_deps: Optional[Set[Tuple[str, str]]] = None
         
-        # Check each table in the order
-        print(f"circular deps = {circular_deps}")
-        for table in order:
-            # Check if all dependencies have been processed
-            for dependent_table in self.reverse_dependencies.get(table, set()):
+        # Every table must come before the tables it references
+        for table, deps in self.dependencies.items():
+            table_position = position[table]
+            for dependency in deps:
+                if position[dependency] >= table_position:
+                    continue
+                
+                if circular_deps is None:
+                    circular_deps = self.circular_dependencies
+                    logger.debug("Detected circular dependencies: %s", circular_deps)
+                
                 # Skip circular dependencies during verification
-                if (dependent_table, table) in circular_deps:
-                    logger.debug(f"Skipping circular dependency check: {dependent_table} -> {table}")
+                if (table, dependency) in circular_deps:
+                    logger.debug("Skipping circular dependency check: %s -> %s", table, dependency)
                     continue
-                    
-                if dependent_table not in processed and dependent_table in order:
-                    print(f"found problematic table: {dependent_table}")
-                    print(f"supposedly {dependent_table} depends on {table}")
-                    logger.error(f"Invalid truncation order: {table} is referenced by {dependent_table}, "
-                                f"but {dependent_table} hasn't been processed yet")
-                    return False
-            
-            # Mark this table as processed
-            processed.add(table)
+                
+                logger.error("Invalid truncation order: %s is referenced by %s, "
+                             "but %s hasn't been processed yet", dependency, table, table)
+                return False
         
         return True
 
+    @property
+    def dependency_arrays(self) -> Tuple[array, array]:
+        """
+        The dependencies in compressed sparse row form, built on first use.
+        
+        Table i is self.tables[i]; the ids of the tables it depends on are
+        indices[indptr[i]:indptr[i + 1]]. Graph walks over these flat int
+        arrays avoid hashing table names.
+        
+        Returns:
+            Tuple of (indptr, indices) int arrays
+        """
+        if self._dependency_arrays is None:
+            table_ids = {table: table_id for table_id, table in enumerate(self.tables)}
+            indptr = array('i', [0])
+            indices = array('i')
+            for table in self.tables:
+                indices.extend(sorted(table_ids[dep] for dep in self.dependencies[table]))
+                indptr.append(len(indices))
+            self._dependency_arrays = (indptr, indices)
+        return self._dependency_arrays
+    
+    @property
+    def circular_dependencies(self) -> FrozenSet[Tuple[str, str]]:
+        """
+        Foreign key edges that are part of a cycle, computed on first use.
+        
+        Returns:
+            Frozen set of (table1, table2) pairs, see _find_circular_dependencies
+        """
+        if self._circular_dependencies is None:
+            self._circular_dependencies = frozenset(self._find_circular_dependencies())
+        return self._circular_dependencies
+    
     def _find_circular_dependencies(self) -> Set[Tuple[str, str]]:
         """
         Find all circular dependencies in the schema.
@@ -210,51 +611,67 @@ class TableDependencyMap:
             and there's a circular path back to table1
         """
         circular_deps = set()
+        tables = self.tables
+        indptr, indices = self.dependency_arrays
         
-        # Find self-references first (simplest form of circular dependency)
-        for table in self.tables:
-            if table in self.dependencies[table]:
-                circular_deps.add((table, table))
+        # Iterative Tarjan over table ids: one pass finds every strongly
+        # connected component
+        unvisited = -1
+        index = array('i', [unvisited]) * len(tables)
+        lowlink = array('i', [0]) * len(tables)
+        on_stack = bytearray(len(tables))
+        scc_stack: List[int] = []
+        next_index = 0
         
-        # Find more complex circular paths
-        for start_table in self.tables:
-            # Skip if we already know this table is in a cycle
-            if any((start_table, other) in circular_deps for other in self.tables):
+        for start in range(len(tables)):
+            if index[start] != unvisited:
                 continue
-                
-            # Do a depth-first search from this table
-            visited = set()
-            path = []
             
-            def dfs(current_table):
-                # If we've seen this table in the current path, we found a cycle
-                if current_table in path:
-                    # Extract and record the cycle
-                    cycle_start = path.index(current_table)
-                    cycle = path[cycle_start:] + [current_table]
-                    # Add all edges in the cycle to circular_deps
-                    for i in range(len(cycle) - 1):
-                        circular_deps.add((cycle[i], cycle[i+1]))
-                    circular_deps.add((cycle[-1], cycle[0]))  # Close the loop
-                    return
-                    
-                # If we've processed this table before, skip it
-                if current_table in visited:
-                    return
-                    
-                # Add to path and mark as visited
-                visited.add(current_table)
-                path.append(current_table)
+            index[start] = lowlink[start] = next_index
+            next_index += 1
+            scc_stack.append(start)
+            on_stack[start] = 1
+            # Each frame is (table id, position of its next dependency)
+            frames = [[start, indptr[start]]]
+            
+            while frames:
+                frame = frames[-1]
+                current, edge = frame
+                if edge < indptr[current + 1]:
+                    frame[1] = edge + 1
+                    dep = indices[edge]
+                    if index[dep] == unvisited:
+                        # Descend into an unvisited table
+                        index[dep] = lowlink[dep] = next_index
+                        next_index += 1
+                        scc_stack.append(dep)
+                        on_stack[dep] = 1
+                        frames.append([dep, indptr[dep]])
+                    elif on_stack[dep]:
+                        lowlink[current] = min(lowlink[current], index[dep])
+                    continue
+                
+                # All dependencies done; pop the frame
+                frames.pop()
+                if frames:
+                    parent = frames[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[current])
                 
-                # Explore dependencies
-                for dep_table in self.dependencies[current_table]:
-                    dfs(dep_table)
+                if lowlink[current] == index[current]:
+                    # current is the root of a component
+                    component = set()
+                    while True:
+                        member = scc_stack.pop()
+                        on_stack[member] = 0
+                        component.add(member)
+                        if member == current:
+                            break
                     
-                # Remove from path as we backtrack
-                path.pop()
-            
-            # Start DFS from the current table
-            dfs(start_table)
+                    # Every edge inside a component (or a self-reference) is on a cycle
+                    for member in component:
+                        for dep in indices[indptr[member]:indptr[member + 1]]:
+                            if dep in component and (len(component) > 1 or dep == member):
+                                circular_deps.add((tables[member], tables[dep]))
         
         return circular_deps
 
@@ -268,43 +685,56 @@ class TableDependencyMap:
         Returns:
             Formatted string representation of the dependency tree
         """
+        # Collect the pieces and join once; repeated += copies the whole string
+        parts: List[str] = []
         if output_format == "markdown":
-            output = "# Database Table Dependencies\n\n"
+            parts.append("# Database Table Dependencies\n\n")
             for table in self.tables:
-                output += f"## {table}\n\n"
+                parts.append(f"## {table}\n\n")
                 
                 if self.dependencies[table]:
-                    output += "### Depends on:\n"
-                    for dep in sorted(self.dependencies[table]):
-                        output += f"- {dep}\n"
-                    output += "\n"
+                    parts.append("### Depends on:\n")
+                    parts.extend(f"- {dep}\n" for dep in sorted(self.dependencies[table]))
+                    parts.append("\n")
                 
                 if self.reverse_dependencies[table]:
-                    output += "### Depended on by:\n"
-                    for dep in sorted(self.reverse_dependencies[table]):
-                        output += f"- {dep}\n"
-                    output += "\n"
+                    parts.append("### Depended on by:\n")
+                    parts.extend(f"- {dep}\n" for dep in sorted(self.reverse_dependencies[table]))
+                    parts.append("\n")
         else:  # text format
-            output = "DATABASE TABLE DEPENDENCIES\n"
-            output += "==========================\n\n"
+            parts.append("DATABASE TABLE DEPENDENCIES\n")
+            parts.append("==========================\n\n")
             
             for table in self.tables:
-                output += f"{table}\n"
-                output += "-" * len(table) + "\n"
+                parts.append(f"{table}\n{'-' * len(table)}\n")
                 
                 if self.dependencies[table]:
-                    output += "  Depends on:\n"
-                    for dep in sorted(self.dependencies[table]):
-                        output += f"    - {dep}\n"
+                    parts.append("  Depends on:\n")
+                    parts.extend(f"    - {dep}\n" for dep in sorted(self.dependencies[table]))
                 
                 if self.reverse_dependencies[table]:
-                    output += "  Depended on by:\n"
-                    for dep in sorted(self.reverse_dependencies[table]):
-                        output += f"    - {dep}\n"
+                    parts.append("  Depended on by:\n")
+                    parts.extend(f"    - {dep}\n" for dep in sorted(self.reverse_dependencies[table]))
                 
-                output += "\n"
+                parts.append("\n")
+        
+        return "".join(parts)
+    
+    @classmethod
+    def from_cached_metadata(cls, metadata: MetaData) -> 'TableDependencyMap':
+        """
+        Create a TableDependencyMap from an already reflected MetaData.
+        
+        No queries are issued, so callers sharing a MetaData get the map
+        for free. Partitions are not known from MetaData alone.
         
-        return output
+        Args:
+            metadata: MetaData holding the reflected tables
+            
+        Returns:
+            Initialized TableDependencyMap instance
+        """
+        return cls(None, metadata=metadata)
     
     @classmethod
     def from_engine(cls, engine: Engine) -> 'TableDependencyMap':
@@ -320,14 +750,54 @@ class TableDependencyMap:
         return cls(engine)
 
 
+def _get_schema_signature(engine: Engine) -> Optional[str]:
+    """
+    Compute a signature that changes whenever tables or foreign keys change.
+    
+    Args:
+        engine: SQLAlchemy engine connected to the database
+        
+    Returns:
+        Signature string, or None if the dialect is not supported
+    """
+    if engine.dialect.name != "postgresql":
+        return None
+    
+    with engine.connect() as conn:
+        return conn.execute(SCHEMA_SIGNATURE_SQL).scalar()
+
+
+def clear_dependency_map_cache() -> None:
+    """
+    Discard all cached dependency maps, e.g. after running migrations.
+    """
+    _DEPENDENCY_MAP_CACHE.clear()
+
+
 def get_dependency_map(engine: Engine) -> TableDependencyMap:
     """
     Factory function to create a TableDependencyMap instance.
     
+    The map is cached per engine while the schema signature is unchanged,
+    so repeated calls cost one catalog query instead of a full reflection.
+    
     Args:
         engine: SQLAlchemy engine connected to the database
         
     Returns:
         Initialized TableDependencyMap instance
     """
-    return TableDependencyMap(engine)
\ No newline at end of file
+    schema_signature = _get_schema_signature(engine)
+    if schema_signature is None:
+        return TableDependencyMap(engine)
+    
+    cached = _DEPENDENCY_MAP_CACHE.get(engine)
+    if cached is not None and cached[0] == schema_signature:
+        return cached[1]
+    
+    dependency_map = TableDependencyMap(engine)
+    # The map holds its engine weakly, so the weakly keyed cache entry goes
+    # away together with the engine
+    dependency_map._hold_engine_weakly()
+    _DEPENDENCY_MAP_CACHE[engine] = (schema_signature, dependency_map)
+    return dependency_map
@@ -1,21 +1,27 @@
 #!/bin/bash
 
+# Test databases are disposable, so commits need not wait for the WAL flush
+export DB_TEST_ASYNC_COMMIT="${DB_TEST_ASYNC_COMMIT:-1}"
+
+# Run tests in parallel, keeping each module or class on one worker
+XDIST_ARGS=(-n auto --dist loadscope)
+
 # Run unit tests only
 run_unit_tests() {
   echo "Running unit tests..."
-  python -m pytest tests/unit
+  python -m pytest "${XDIST_ARGS[@]}" tests/unit
 }
 
 # Run integration tests only 
 run_integration_tests() {
   echo "Running integration tests..."
-  python -m pytest tests/integration
+  python -m pytest "${XDIST_ARGS[@]}" tests/integration
 }
 
 # Run all tests
 run_all_tests() {
   echo "Running all tests..."
-  python -m pytest
+  python -m pytest "${XDIST_ARGS[@]}"
 }
 
 # Main logic
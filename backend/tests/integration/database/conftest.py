@@ -10,9 +10,15 @@ import logging
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, Session
 
+from app.database.connection import clear_engine_cache, get_cached_engine
+from app.utils.table_dependency import get_dependency_map
+
 # Configure logging for tests
 logger = logging.getLogger(__name__)
 
+# Prefix of the per-worker tables created by the scratch_table fixture
+SCRATCH_TABLE_PREFIX = "scratch_"
+
 
 def get_test_database_url():
     """
@@ -65,6 +71,75 @@ def test_engine():
     engine.dispose()
 
 
+@pytest.fixture(scope="session")
+def engine():
+    """
+    Create an engine with the application's connection settings, shared by
+    all tests in the session so the connection pool stays warm.
+    
+    Returns:
+        Engine: SQLAlchemy engine from get_cached_engine
+    """
+    engine = get_cached_engine(get_test_database_url())
+    
+    # Open the first pooled connection up front
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    
+    yield engine
+    
+    # Dispose and forget it, so get_cached_engine never hands out a disposed engine
+    clear_engine_cache()
+
+
+@pytest.fixture(scope="session")
+def scratch_table(engine):
+    """
+    Create a table private to this pytest-xdist worker, so tests that lock
+    a table don't block tests running in other workers.
+    
+    Args:
+        engine: SQLAlchemy engine (from fixture)
+    
+    Yields:
+        str: Name of the scratch table
+    """
+    worker_id = os.environ.get("PYTEST_XDIST_WORKER", "gw0")
+    table_name = f"{SCRATCH_TABLE_PREFIX}{worker_id}"
+    
+    with engine.begin() as conn:
+        conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{table_name}" (id INTEGER)'))
+    
+    yield table_name
+    
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
+
+
+@pytest.fixture
+def advisory_lock(engine):
+    """
+    Hold a PostgreSQL advisory lock on a separate connection for the test, so
+    a test taking the same lock blocks until its statement timeout fires.
+    The key is per pytest-xdist worker, so parallel workers don't contend.
+    
+    Args:
+        engine: SQLAlchemy engine (from fixture)
+    
+    Yields:
+        int: Key of the held advisory lock
+    """
+    worker_id = os.environ.get("PYTEST_XDIST_WORKER", "gw0")
+    lock_key = 42_000 + int(worker_id.lstrip("gw") or 0)
+    
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": lock_key})
+        try:
+            yield lock_key
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": lock_key})
+
+
 @pytest.fixture(scope="session")
 def test_session_factory(test_engine):
     """
@@ -122,13 +197,26 @@ def clean_tables(test_engine):
         test_engine: SQLAlchemy engine (from fixture)
     
     Returns:
-        function: Function to clean specified tables
+        function: Function to clean the specified tables, or all application
+            tables when called without arguments
     """
-    def _clean_tables(table_names):
+    def _clean_tables(table_names=None):
+        # Default to every table in FK-safe order, except the scratch tables
+        # that other pytest-xdist workers may be using
+        if table_names is None:
+            table_names = [
+                table_name
+                for table_name in get_dependency_map(test_engine).get_truncation_order()
+                if not table_name.startswith(SCRATCH_TABLE_PREFIX)
+            ]
+        if not table_names:
+            return
+        
+        # One statement for all tables: one round-trip and one commit
+        table_list = ", ".join(f'"{table_name}"' for table_name in table_names)
         with test_engine.begin() as conn:
-            for table_name in table_names:
-                conn.execute(text(f'TRUNCATE TABLE "{table_name}" RESTART IDENTITY CASCADE'))
-                logger.info(f"Cleaned table: {table_name}")
+            conn.execute(text(f"TRUNCATE TABLE {table_list} RESTART IDENTITY CASCADE"))
+        logger.info(f"Cleaned {len(table_names)} tables")
     
     return _clean_tables
 
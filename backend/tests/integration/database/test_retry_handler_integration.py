@@ -9,8 +9,9 @@ import threading
 import pytest
 from sqlalchemy import text
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
 
-from app.database.connection import db_session, get_engine
+from app.database.connection import db_session
 from app.database.retry_handler import (
     retry_database_operation,
     with_timeout,
@@ -19,20 +20,26 @@ from app.database.retry_handler import (
     MaxRetriesExceededError
 )
 
+# Statements are built once and reused by every test
+_TAKE_ADVISORY_LOCK = text("SELECT pg_advisory_lock(:key)")
+
+# Literal statements without parameters, run through exec_driver_sql to skip
+# SQL compilation
+_SELECT_1 = "SELECT 1"
+_SELECT_42 = "SELECT 42"
+_SELECT_123 = "SELECT 123"
+_SELECT_999 = "SELECT 999"
+_SHOW_STATEMENT_TIMEOUT = "SHOW statement_timeout"
+
 
 class TestRetryHandlerIntegration:
     """Integration tests for retry handler with actual database operations."""
 
-    @pytest.fixture
-    def engine(self):
-        """Create a database engine for tests."""
-        return get_engine()
-
     def test_successful_query_with_retry(self, engine):
         """Test that a successful query works with retry decorator."""
         @retry_database_operation(max_retries=2, initial_delay=0.01)
         def execute_query(connection):
-            return connection.execute(text("SELECT 1")).scalar()
+            return connection.exec_driver_sql(_SELECT_1).scalar()
 
         with engine.connect() as conn:
             result = execute_query(conn)
@@ -42,7 +49,7 @@ class TestRetryHandlerIntegration:
         """Test that a successful query works with timeout decorator."""
         @with_timeout(timeout=5.0)
         def execute_query(connection):
-            return connection.execute(text("SELECT pg_sleep(0.1), 42")).fetchone()[1]
+            return connection.exec_driver_sql(_SELECT_42).scalar()
 
         with engine.connect() as conn:
             result = execute_query(conn)
@@ -52,22 +59,20 @@ class TestRetryHandlerIntegration:
         """Test that a successful query works with combined safe_db_operation decorator."""
         @safe_db_operation(max_retries=2, timeout=5.0)
         def execute_query(connection):
-            return connection.execute(text("SELECT 123")).scalar()
+            return connection.exec_driver_sql(_SELECT_123).scalar()
 
         with engine.connect() as conn:
             result = execute_query(conn)
             assert result == 123
 
-    def test_timeout_for_slow_query(self, engine):
+    def test_timeout_for_slow_query(self, engine, advisory_lock):
         """Test that timeout works for a slow database query."""
         # Create a session instead of a direct connection
-        from sqlalchemy.orm import Session
-        
         with Session(engine) as session:
-            @with_timeout(timeout=0.1)
+            @with_timeout(timeout=0.05)
             def execute_slow_query(session_obj):
-                # This query will sleep for 1 second, which should trigger timeout
-                return session_obj.execute(text("SELECT pg_sleep(1), 42")).fetchone()
+                # This query waits on the held lock, which should trigger timeout
+                return session_obj.execute(_TAKE_ADVISORY_LOCK, {"key": advisory_lock}).fetchone()
 
             with pytest.raises(Exception) as excinfo:
                 execute_slow_query(session)
@@ -80,7 +85,7 @@ class TestRetryHandlerIntegration:
         """Test retry functionality with a simulated temporary database error."""
         attempts = [0]
 
-        @retry_database_operation(max_retries=2, initial_delay=0.01)
+        @retry_database_operation(max_retries=2, initial_delay=0.01, max_delay=1.0)
         def operation_with_temporary_error():
             attempts[0] += 1
             if attempts[0] <= 1:
@@ -88,72 +93,79 @@ class TestRetryHandlerIntegration:
                 raise OperationalError("temporary error", {}, Exception("connection reset"))
             return "success"
 
+        start_time = time.monotonic()
         result = operation_with_temporary_error()
+        elapsed = time.monotonic() - start_time
         assert result == "success"
         assert attempts[0] == 2  # Verify it took 2 attempts
+        # Jittered sleeps never exceed the exponential schedule
+        assert elapsed < sum(0.01 * 2 ** k for k in range(2)) + 0.5
 
     def test_session_with_retry(self):
         """Test retry functionality with database session context manager."""
         @retry_database_operation(max_retries=2, initial_delay=0.01)
         def db_operation(session):
-            result = session.execute(text("SELECT 999")).scalar()
+            result = session.connection().exec_driver_sql(_SELECT_999).scalar()
             return result
 
         with db_session() as session:
             result = db_operation(session)
             assert result == 999
 
-    def test_statement_timeout_in_session(self):
+    def test_statement_timeout_in_session(self, engine, advisory_lock):
         """Test that statement timeout is correctly set in the session."""
-        @with_timeout(timeout=0.3)
+        @with_timeout(timeout=0.05)
         def execute_with_timeout(session):
             # First check if timeout was set
-            timeout_result = session.execute(text("SHOW statement_timeout")).scalar()
-            assert timeout_result == "300ms", "Statement timeout was not set correctly"
+            timeout_result = session.connection().exec_driver_sql(_SHOW_STATEMENT_TIMEOUT).scalar()
+            assert timeout_result == "50ms", "Statement timeout was not set correctly"
             
             try:
-                # Try a query that should exceed the timeout
-                session.execute(text("SELECT pg_sleep(1)"))
+                # Try a query that waits on the held lock past the timeout
+                session.execute(_TAKE_ADVISORY_LOCK, {"key": advisory_lock})
                 return False  # Should not reach here
             except Exception as e:
                 # Verify it's a timeout-related error
                 error_text = str(e).lower()
                 return "timeout" in error_text or "statement" in error_text
         
-        with db_session() as session:
+        # Use the test engine, since advisory locks are per database
+        with Session(engine) as session:
             result = execute_with_timeout(session)
             assert result is True, "Query should have timed out"
 
-    def test_connection_blocking_with_safe_operation(self, engine):
+    def test_connection_blocking_with_safe_operation(self, engine, scratch_table):
         """
         Test safe operation with high timeout when connection is blocked.
         This simulates a scenario where the connection is temporarily unavailable.
         """
-        # Create a lock to synchronize threads
-        execution_lock = threading.Lock()
-        execution_lock.acquire()  # Lock initially
+        # Lock this worker's own table so parallel workers aren't blocked
+        lock_scratch_table = f'LOCK TABLE "{scratch_table}" IN ACCESS EXCLUSIVE MODE'
+        count_scratch_table = text(f'SELECT count(*) FROM "{scratch_table}"')
+        
+        # Signalled once the blocking thread holds the table lock
+        lock_acquired = threading.Event()
         
         # Track when the blocking query is released
         release_time = [0]
         
         # Function to block the database for a short time
         def block_database():
-            with engine.connect() as conn:
-                # Execute a query that will hold a lock
-                conn.execute(text("BEGIN"))
-                conn.execute(text("LOCK TABLE pg_catalog.pg_class IN ACCESS EXCLUSIVE MODE"))
+            with engine.connect() as conn, conn.begin() as transaction:
+                # The driver opens the transaction together with the lock
+                conn.exec_driver_sql(lock_scratch_table)
+                
+                # Signal the main thread that the lock has been acquired
+                lock_acquired.set()
                 
-                # Hold the lock for a half second
-                time.sleep(0.5)
+                # Hold the lock just long enough for the query to hit it
+                time.sleep(0.05)
                 
                 # Record when we release the lock
-                release_time[0] = time.time()
+                release_time[0] = time.monotonic()
                 
                 # Release the lock
-                conn.execute(text("ROLLBACK"))
-                
-                # Signal the main thread that the lock has been acquired
-                execution_lock.release()
+                transaction.rollback()
         
         # Start a thread to block the database
         blocking_thread = threading.Thread(target=block_database)
@@ -161,21 +173,20 @@ class TestRetryHandlerIntegration:
         blocking_thread.start()
         
         # Function that will retry when the database is blocked
-        @safe_db_operation(max_retries=3, timeout=2.0, initial_delay=0.1)
+        @safe_db_operation(max_retries=5, timeout=2.0, initial_delay=0.01, max_delay=1.0)
         def query_during_block(connection):
-            # Try to execute a query that requires the catalog
-            return connection.execute(text("SELECT count(*) FROM pg_catalog.pg_class")).scalar()
+            # Try to execute a query that requires the locked table
+            return connection.execute(count_scratch_table).scalar()
         
         # Wait for the blocking thread to acquire its lock
-        execution_lock.acquire()
+        assert lock_acquired.wait(timeout=5.0), "Blocking thread did not acquire the lock"
         
         # Now try to execute our query with retry - it should succeed after the block is released
-        start_time = time.time()
         with engine.connect() as conn:
             count = query_during_block(conn)
             
-        end_time = time.time()
+        end_time = time.monotonic()
         
         # Verify that our query waited for the release and then succeeded
-        assert count > 0, "Should have received a valid count"
+        assert count == 0, "Should have received a valid count"
         assert end_time > release_time[0], "Query should complete after the lock was released"
\ No newline at end of file
@@ -3,72 +3,133 @@
 Pytest fixtures for database unit tests.
 """
 
+import os
 import pytest
 from unittest.mock import MagicMock, patch
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
 
-from app.database.connection import get_engine, get_session_factory
+@pytest.fixture(autouse=True)
+def _null_pool_engines(monkeypatch):
+    """
+    Make engines created during unit tests skip connection pooling, since
+    unit tests never hold on to real connections. An explicit DB_POOL_MODE
+    is left alone. Function-scoped, so the setting is undone after each test
+    and never reaches tests outside this package.
+    """
+    if "DB_POOL_MODE" not in os.environ:
+        monkeypatch.setenv("DB_POOL_MODE", "null")
 
 
-@pytest.fixture
+@pytest.fixture(autouse=True)
+def _synchronous_commit_engines(monkeypatch):
+    """
+    Ignore a DB_TEST_ASYNC_COMMIT exported by the test runner, so engine
+    options asserted by unit tests don't depend on how pytest was started.
+    """
+    monkeypatch.delenv("DB_TEST_ASYNC_COMMIT", raising=False)
+
+
+class _StubResult:
+    """Minimal stand-in for a SQLAlchemy result holding one scalar value."""
+    
+    def __init__(self, value):
+        self._value = value
+    
+    def scalar(self):
+        return self._value
+
+
+# Results are immutable, so every stub shares one
+_RESULT_ONE = _StubResult(1)
+
+
+class _StubConnection:
+    """Minimal stand-in for a SQLAlchemy connection used as a context manager."""
+    
+    def __init__(self):
+        self.execute = MagicMock(return_value=_RESULT_ONE)
+    
+    def reset_mock(self):
+        self.execute.reset_mock()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class _StubEngine:
+    """Minimal stand-in for a SQLAlchemy engine whose connections return 1."""
+    
+    def __init__(self):
+        self.connection = _StubConnection()
+        self.connect = MagicMock(return_value=self.connection)
+    
+    def reset_mock(self):
+        self.connect.reset_mock()
+        self.connection.reset_mock()
+
+
+class _StubSession:
+    """Minimal stand-in for a SQLAlchemy session whose queries return 1."""
+    
+    def __init__(self):
+        self.execute = MagicMock(return_value=_RESULT_ONE)
+    
+    def reset_mock(self):
+        self.execute.reset_mock()
+
+
+# The stubs are much cheaper to build than MagicMock trees or spec'd mocks,
+# and keep MagicMock only where tests assert on calls. They are built once per
+# module and reset after every test.
+
+@pytest.fixture(autouse=True)
+def _reset_mocks(request):
+    """
+    Reset the module-scoped mocks after each test, so recorded calls don't
+    leak between tests.
+    """
+    yield
+    for name in ("mock_engine", "mock_session"):
+        stub = request.node.funcargs.get(name)
+        if stub is not None:
+            stub.reset_mock()
+
+
+@pytest.fixture(scope="module")
 def mock_engine():
     """
     Fixture for a mock SQLAlchemy engine.
     
     Returns:
-        MagicMock: A mock engine object
+        _StubEngine: A stub engine whose connection executes to a result of 1
     """
-    engine = MagicMock()
-    
-    # Mock the connect method and connection context
-    mock_connection = MagicMock()
-    mock_result = MagicMock()
-    mock_result.scalar.return_value = 1
-    mock_connection.execute.return_value = mock_result
-    
-    # Make engine's connect method return a connection context
-    engine.connect.return_value.__enter__.return_value = mock_connection
-    
-    return engine
+    return _StubEngine()
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def mock_session():
     """
     Fixture for a mock SQLAlchemy session.
     
     Returns:
-        MagicMock: A mock session object
+        _StubSession: A stub session whose execute returns a result of 1
     """
-    session = MagicMock(spec=Session)
-    
-    # Mock session methods
-    mock_result = MagicMock()
-    mock_result.scalar.return_value = 1
-    session.execute.return_value = mock_result
-    
-    return session
+    return _StubSession()
 
 
 @pytest.fixture
 def patched_engine():
     """
     Fixture that patches the get_engine function to return a mock engine.
+    Function-scoped, so the patch doesn't outlive the test that asked for it.
     
     Yields:
-        MagicMock: The mock engine being used
+        _StubEngine: The stub engine being used
     """
-    engine = MagicMock()
-    
-    # Configure mock engine behavior
-    mock_connection = MagicMock()
-    mock_result = MagicMock()
-    mock_result.scalar.return_value = 1
-    mock_connection.execute.return_value = mock_result
-    
-    engine.connect.return_value.__enter__.return_value = mock_connection
+    engine = _StubEngine()
     
     with patch('app.database.connection.get_engine', return_value=engine):
-        yield engine
\ No newline at end of file
+        yield engine
@@ -3,183 +3,207 @@
 Unit tests for database retry handler functionality.
 """
 
-from itertools import chain, repeat
-import time
-import unittest
+import threading
 from unittest.mock import MagicMock, patch
 
 import pytest
 import sqlalchemy.exc
-from sqlalchemy.orm import Session
 
 from app.database.retry_handler import (
+    CircuitBreaker,
+    CircuitOpenError,
     DatabaseTimeoutError,
     MaxRetriesExceededError,
     retry_database_operation,
-    with_timeout,
     safe_db_operation,
+    _classify,
+    _random,
     RETRIABLE_EXCEPTIONS,
     NON_RETRIABLE_EXCEPTIONS
 )
 
 
+def make_seq(results):
+    """Build a callable that raises or returns the given results in order.
+    
+    A plain function keeps retry-loop tests free of MagicMock call bookkeeping.
+    The number of calls made so far is available as ``f.calls[0]``.
+    """
+    results = iter(results)
+    calls = [0]
+    
+    def f(*args, **kwargs):
+        calls[0] += 1
+        value = next(results)
+        if isinstance(value, BaseException):
+            raise value
+        return value
+    
+    f.calls = calls
+    return f
+
+
+class _CustomException(Exception):
+    """Exception in neither the retriable nor the non-retriable list."""
+
+
+# Decorators hold no per-function state, so parametrized cases share them
+_RETRY = retry_database_operation(initial_delay=0.01)
+_RETRY_TWICE = retry_database_operation(max_retries=2, initial_delay=0.01)
+_RETRY_VALUE_ERROR = retry_database_operation(
+    initial_delay=0.01,
+    retriable_exceptions=(ValueError,)
+)
+
+_CONNECTION_ERROR = sqlalchemy.exc.OperationalError("statement", {}, Exception("connection error"))
+_DATA_ERROR = sqlalchemy.exc.DataError("Invalid data format", None, None)
+
+
 class TestRetryDatabaseOperation:
     """Test cases for retry_database_operation decorator."""
 
-    def test_successful_operation(self):
-        """Test that a successful operation completes normally."""
-        mock_func = MagicMock(return_value="success")
-        decorated_func = retry_database_operation()(mock_func)
+    @pytest.mark.parametrize("retry, results, raises, calls", [
+        # A successful operation completes normally
+        (_RETRY, ["success"], None, 1),
+        # Retriable exceptions are retried
+        (_RETRY, [_CONNECTION_ERROR, "success"], None, 2),
+        # MaxRetriesExceededError is raised after max retries (initial + 2 retries)
+        (_RETRY_TWICE, [_CONNECTION_ERROR] * 3, MaxRetriesExceededError, 3),
+        # Exceptions in NON_RETRIABLE_EXCEPTIONS are not retried
+        (_RETRY, [_DATA_ERROR], sqlalchemy.exc.DataError, 1),
+        # Exceptions in neither list are not retried
+        (_RETRY, [_CustomException("Custom exception")], _CustomException, 1),
+        # Custom retriable exceptions are retried
+        (_RETRY_VALUE_ERROR, [ValueError("Custom error"), "success"], None, 2),
+    ])
+    def test_retry_outcomes(self, retry, results, raises, calls):
+        """Test how retry_database_operation handles each kind of outcome."""
+        func = make_seq(results)
+        decorated_func = retry(func)
         
-        result = decorated_func()
+        if raises is None:
+            assert decorated_func() == "success"
+        else:
+            with pytest.raises(raises):
+                decorated_func()
         
-        assert result == "success"
-        mock_func.assert_called_once()
+        assert func.calls[0] == calls
     
-    def test_retry_on_retriable_exception(self):
-        """Test that the function retries on retriable exceptions."""
-        mock_func = MagicMock(
-            side_effect=[
-                sqlalchemy.exc.OperationalError("statement", {}, Exception("connection error")),
-                "success"
-            ]
-        )
+    def test_no_retry_on_deterministic_sqlstate(self):
+        """Test that errors with a non-transient SQLSTATE fail on the first attempt."""
+        orig = Exception("duplicate key value violates unique constraint")
+        orig.pgcode = "23505"
+        error = sqlalchemy.exc.IntegrityError("statement", {}, orig)
+        mock_func = MagicMock(side_effect=error)
         decorated_func = retry_database_operation(initial_delay=0.01)(mock_func)
         
-        result = decorated_func()
-        
-        assert result == "success"
-        assert mock_func.call_count == 2
-    
-    def test_max_retries_exceeded(self):
-        """Test that MaxRetriesExceededError is raised after max retries."""
-        error = sqlalchemy.exc.OperationalError("statement", {}, Exception("connection error"))
-        mock_func = MagicMock(side_effect=[error, error, error])
-        decorated_func = retry_database_operation(max_retries=2, initial_delay=0.01)(mock_func)
-        
-        with pytest.raises(MaxRetriesExceededError):
-            decorated_func()
-        
-        assert mock_func.call_count == 3  # Initial + 2 retries
-    
-    def test_non_retriable_exceptions(self):
-        """Test that non-retriable exceptions are not retried."""
-        # Test with an exception that's explicitly in NON_RETRIABLE_EXCEPTIONS
-        data_error = sqlalchemy.exc.DataError("Invalid data format", None, None)
-        mock_func = MagicMock(side_effect=data_error)
-        
-        decorated_func = retry_database_operation(
-            initial_delay=0.01  # Small delay for faster tests
-        )(mock_func)
-        
-        with pytest.raises(sqlalchemy.exc.DataError):
+        with pytest.raises(sqlalchemy.exc.IntegrityError):
             decorated_func()
         
-        # Verify it was only called once (no retries)
         mock_func.assert_called_once()
+    
+    def test_retry_on_transient_sqlstate(self):
+        """Test that serialization failures are retried."""
+        orig = Exception("could not serialize access")
+        orig.sqlstate = "40001"
+        error = sqlalchemy.exc.OperationalError("statement", {}, orig)
+        mock_func = MagicMock(side_effect=[error, "success"])
+        decorated_func = retry_database_operation(initial_delay=0.01)(mock_func)
         
-        # Reset the mock
-        mock_func.reset_mock()
-        
-        # Now test with a custom exception that's not in either list
-        class CustomException(Exception):
-            pass
-        
-        custom_error = CustomException("Custom exception")
-        mock_func = MagicMock(side_effect=custom_error)
+        assert decorated_func() == "success"
+        assert mock_func.call_count == 2
+    
+    def test_retry_on_statement_timeout(self):
+        """Test that statements canceled by statement_timeout are retried."""
+        orig = Exception("canceling statement due to statement timeout")
+        orig.pgcode = "57014"
+        error = sqlalchemy.exc.OperationalError("statement", {}, orig)
+        mock_func = MagicMock(side_effect=[error, "success"])
+        decorated_func = safe_db_operation(initial_delay=0.01)(mock_func)
         
-        decorated_func = retry_database_operation(
-            initial_delay=0.01
-        )(mock_func)
+        assert decorated_func() == "success"
+        assert mock_func.call_count == 2
+    
+    def test_no_retry_on_integrity_error_without_sqlstate(self):
+        """Test that constraint violations are never retried."""
+        error = sqlalchemy.exc.IntegrityError("statement", {}, Exception("constraint violated"))
+        mock_func = MagicMock(side_effect=error)
+        decorated_func = retry_database_operation(initial_delay=0.01)(mock_func)
         
-        with pytest.raises(CustomException):
+        with pytest.raises(sqlalchemy.exc.IntegrityError):
             decorated_func()
         
-        # Verify it was only called once (no retries)
         mock_func.assert_called_once()
     
-    def test_retry_with_custom_exceptions(self):
-        """Test retry with custom retriable exceptions."""
-        custom_exception = ValueError("Custom error")
-        mock_func = MagicMock(side_effect=[custom_exception, "success"])
+    def test_classification_cached_per_configuration(self):
+        """Test that exception classification depends on the decorator's exception lists."""
+        assert _classify(sqlalchemy.exc.DataError, RETRIABLE_EXCEPTIONS, NON_RETRIABLE_EXCEPTIONS) == "noretry"
+        assert _classify(sqlalchemy.exc.IntegrityError, RETRIABLE_EXCEPTIONS, NON_RETRIABLE_EXCEPTIONS) == "noretry"
+        assert _classify(sqlalchemy.exc.OperationalError, RETRIABLE_EXCEPTIONS, NON_RETRIABLE_EXCEPTIONS) == "retry"
+        assert _classify(ValueError, RETRIABLE_EXCEPTIONS, NON_RETRIABLE_EXCEPTIONS) == "unknown"
+        assert _classify(ValueError, (ValueError,), NON_RETRIABLE_EXCEPTIONS) == "retry"
+    
+    def test_backoff_delay_increases(self):
+        """Test that backoff delay increases with retries."""
+        sleeps = []
+        error = sqlalchemy.exc.OperationalError("statement", {}, Exception("connection error"))
+        func = make_seq([error, error, error, "success"])
+        
         decorated_func = retry_database_operation(
-            initial_delay=0.01,
-            retriable_exceptions=(ValueError,)
-        )(mock_func)
+            max_retries=3,
+            initial_delay=0.1,
+            backoff_factor=2,
+            jitter="none",
+            sleep=sleeps.append
+        )(func)
         
         result = decorated_func()
         
         assert result == "success"
-        assert mock_func.call_count == 2
+        assert func.calls[0] == 4
+        
+        # Check sleep durations follow backoff pattern
+        assert sleeps == [0.1, 0.2, 0.4]
     
-    def test_backoff_delay_increases(self):
-        """Test that backoff delay increases with retries."""
-        with patch('time.sleep') as mock_sleep:
+    def test_full_jitter_delays_within_backoff(self):
+        """Test that full jitter sleeps between zero and the backoff delay."""
+        with patch('time.sleep') as mock_sleep, \
+             patch('app.database.retry_handler._random') as mock_random:
+            mock_uniform = mock_random.return_value.uniform
+            mock_uniform.side_effect = lambda low, high: high / 2
             error = sqlalchemy.exc.OperationalError("statement", {}, Exception("connection error"))
             mock_func = MagicMock(side_effect=[error, error, error, "success"])
             
             decorated_func = retry_database_operation(
                 max_retries=3,
                 initial_delay=0.1,
-                backoff_factor=2
+                max_delay=0.3,
+                backoff_factor=2,
+                jitter="full"
             )(mock_func)
             
-            result = decorated_func()
-            
-            assert result == "success"
-            assert mock_func.call_count == 4
+            assert decorated_func() == "success"
             
-            # Check sleep durations follow backoff pattern
-            assert mock_sleep.call_count == 3
-            assert mock_sleep.call_args_list[0][0][0] == 0.1
-            assert mock_sleep.call_args_list[1][0][0] == 0.2
-            assert mock_sleep.call_args_list[2][0][0] == 0.4
-
-
-class TestWithTimeout:
-    """Test cases for with_timeout decorator."""
-    
-    def test_operation_within_timeout(self):
-        """Test that an operation within the timeout completes normally."""
-        mock_func = MagicMock(return_value="success")
-        decorated_func = with_timeout(timeout=1.0)(mock_func)
-        
-        result = decorated_func()
-        
-        assert result == "success"
-        mock_func.assert_called_once()
+            # Check each delay is drawn from [0, capped backoff]
+            assert [c.args for c in mock_uniform.call_args_list] == [
+                (0, 0.1), (0, 0.2), (0, 0.3)
+            ]
+            assert [c.args[0] for c in mock_sleep.call_args_list] == [0.05, 0.1, 0.15]
     
-    @patch('time.time')
-    def test_operation_timeout(self, mock_time):
-        """Test that DatabaseTimeoutError is raised when the operation times out."""
-        # Make mock_time return 0 first, then 2.0 for all subsequent calls
-        mock_time.side_effect = [0] + [2.0] * 10  # Provide enough values for logging too
+    def test_random_is_per_thread(self):
+        """Test that each thread gets its own random generator."""
+        other_thread_rng = []
+        thread = threading.Thread(target=lambda: other_thread_rng.append(_random()))
+        thread.start()
+        thread.join()
         
-        mock_func = MagicMock(side_effect=Exception("Operation failed"))
-        decorated_func = with_timeout(timeout=1.0)(mock_func)
-        
-        with pytest.raises(DatabaseTimeoutError):
-            decorated_func()
+        assert _random() is _random()
+        assert other_thread_rng[0] is not _random()
     
-    @patch('app.database.retry_handler.text')
-    def test_statement_timeout_for_session(self, mock_text):
-        """Test that statement_timeout is set for PostgreSQL sessions."""
-        # Make mock_text return the input string or another recognizable value
-        mock_text.return_value = "TEXT_CLAUSE"
-        
-        mock_session = MagicMock(spec=Session)
-        mock_execute = MagicMock()
-        mock_session.execute = mock_execute
-
-        def func_with_session(session):
-            return "success"
-
-        decorated_func = with_timeout(timeout=2.0)(func_with_session)
-        result = decorated_func(mock_session)
-
-        assert result == "success"
-        mock_text.assert_called_once_with("SET statement_timeout = 2000")
-        mock_execute.assert_called_once_with("TEXT_CLAUSE")
+    def test_unknown_jitter_mode(self):
+        """Test that an unknown jitter mode is rejected."""
+        with pytest.raises(ValueError):
+            retry_database_operation(jitter="random")
 
 
 class TestSafeDatabaseOperation:
@@ -208,27 +232,145 @@ class TestSafeDatabaseOperation:
             # Second call succeeds
             return "success"
         
-        # Use patch to avoid actual time delays
-        with patch('time.sleep'):
-            decorated_func = safe_db_operation(max_retries=2, timeout=1.0)(test_function)
-            result = decorated_func()
+        # Record delays instead of actually sleeping
+        sleeps = []
+        decorated_func = safe_db_operation(
+            max_retries=2, timeout=1.0, sleep=sleeps.append
+        )(test_function)
+        result = decorated_func()
+        
+        assert result == "success"
+        assert calls[0] == 2  # Function should be called twice
+        assert len(sleeps) == 1
+    
+    def test_backoff_does_not_exceed_timeout(self):
+        """Test that a retry whose backoff would overrun the timeout is not attempted."""
+        mock_func = MagicMock(
+            side_effect=sqlalchemy.exc.OperationalError("statement", {}, Exception("connection error"))
+        )
+        
+        with patch('time.sleep') as mock_sleep:
+            decorated_func = safe_db_operation(
+                max_retries=3, timeout=1.0, initial_delay=5.0, jitter="none"
+            )(mock_func)
             
-            assert result == "success"
-            assert calls[0] == 2  # Function should be called twice
+            with pytest.raises(DatabaseTimeoutError):
+                decorated_func()
+        
+        mock_sleep.assert_not_called()
+        assert mock_func.call_count == 1
     
-    @patch('time.time')
-    def test_timeout_takes_precedence(self, mock_time):
-        # First call returns 0, then all subsequent calls return 2.0
-        mock_time.side_effect = chain([0], repeat(2.0))
+    def test_circuit_opens_after_repeated_failures(self):
+        """Test that calls fail fast once the circuit breaker opens."""
+        calls = [0]
+        
+        def failing_function():
+            calls[0] += 1
+            raise sqlalchemy.exc.OperationalError("statement", {}, Exception("connection error"))
         
-        # Create a function that always fails with a retriable error
+        with patch('time.sleep'):
+            decorated_func = safe_db_operation(
+                max_retries=0, timeout=1.0, circuit_breaker=CircuitBreaker()
+            )(failing_function)
+            
+            # Each call fails after running the function
+            for _ in range(5):
+                with pytest.raises(MaxRetriesExceededError):
+                    decorated_func()
+            assert calls[0] == 5
+            
+            # The circuit is now open, so the function is not called
+            with pytest.raises(CircuitOpenError):
+                decorated_func()
+            assert calls[0] == 5
+    
+    def test_no_circuit_breaker_by_default(self):
+        """Test that operations without a circuit breaker never fail fast."""
         mock_func = MagicMock(
             side_effect=sqlalchemy.exc.OperationalError("statement", {}, Exception("connection error"))
         )
         
-        decorated_func = safe_db_operation(max_retries=3, timeout=1.0)(mock_func)
+        decorated_func = safe_db_operation(max_retries=0, timeout=1.0)(mock_func)
+        for _ in range(10):
+            with pytest.raises(MaxRetriesExceededError):
+                decorated_func()
+        assert mock_func.call_count == 10
+    
+    def test_nested_open_circuit_not_counted(self):
+        """Test that an inner open circuit is not a failure of the outer breaker."""
+        inner_breaker = CircuitBreaker(failure_threshold=1)
+        inner_breaker.record_failure()
+        outer_breaker = CircuitBreaker(failure_threshold=1)
         
-        with pytest.raises(DatabaseTimeoutError):
-            decorated_func()
+        inner = safe_db_operation(max_retries=0, circuit_breaker=inner_breaker)(MagicMock())
+        outer = safe_db_operation(max_retries=0, circuit_breaker=outer_breaker)(
+            lambda: inner()
+        )
         
-        assert mock_func.call_count == 1
+        with pytest.raises(CircuitOpenError):
+            outer()
+        assert outer_breaker.state == CircuitBreaker.CLOSED
+        assert outer_breaker.failure_count == 0
+
+
+class TestCircuitBreaker:
+    """Test cases for CircuitBreaker."""
+    
+    def test_opens_after_threshold(self):
+        """Test that the breaker opens after consecutive failures."""
+        breaker = CircuitBreaker(failure_threshold=2)
+        
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+    
+    def test_success_resets_failure_count(self):
+        """Test that a success in between failures keeps the breaker closed."""
+        breaker = CircuitBreaker(failure_threshold=2)
+        
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.allow()
+    
+    @patch('time.monotonic')
+    def test_half_open_closes_after_successes(self, mock_monotonic):
+        """Test the transition from open to half-open to closed."""
+        mock_monotonic.return_value = 100.0
+        breaker = CircuitBreaker(
+            failure_threshold=1, reset_timeout=10, half_open_successes_needed=2
+        )
+        breaker.record_failure()
+        
+        # Still open before the reset timeout
+        mock_monotonic.return_value = 105.0
+        assert not breaker.allow()
+        
+        # Half-open after the reset timeout
+        mock_monotonic.return_value = 111.0
+        assert breaker.allow()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+    
+    @patch('time.monotonic')
+    def test_half_open_failure_reopens(self, mock_monotonic):
+        """Test that a failed trial call reopens the circuit."""
+        mock_monotonic.return_value = 100.0
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+        breaker.record_failure()
+        
+        mock_monotonic.return_value = 111.0
+        assert breaker.allow()
+        breaker.record_failure()
+        
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
@@ -0,0 +1,177 @@
+# backend/tests/unit/database/test_with_timeout.py
+"""
+Unit tests for database timeout handling.
+"""
+
+from itertools import chain, repeat
+from unittest.mock import MagicMock, patch
+
+import pytest
+import sqlalchemy.exc
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.database.retry_handler import (
+    DatabaseTimeoutError,
+    with_timeout,
+    safe_db_operation,
+    register_statement_timeout,
+    STATEMENT_TIMEOUT_INFO_KEY
+)
+
+
+class TestWithTimeout:
+    """Test cases for with_timeout decorator."""
+    
+    def test_operation_within_timeout(self):
+        """Test that an operation within the timeout completes normally."""
+        mock_func = MagicMock(return_value="success")
+        decorated_func = with_timeout(timeout=1.0)(mock_func)
+        
+        result = decorated_func()
+        
+        assert result == "success"
+        mock_func.assert_called_once()
+    
+    @patch('time.monotonic')
+    def test_operation_timeout(self, mock_time):
+        """Test that DatabaseTimeoutError is raised when the operation times out."""
+        # Make mock_time return 0 first, then 2.0 for all subsequent calls
+        mock_time.side_effect = [0] + [2.0] * 10  # Provide enough values for logging too
+        
+        mock_func = MagicMock(side_effect=Exception("Operation failed"))
+        decorated_func = with_timeout(timeout=1.0)(mock_func)
+        
+        with pytest.raises(DatabaseTimeoutError):
+            decorated_func()
+    
+    def test_statement_timeout_for_session(self):
+        """Test that statement_timeout is set for PostgreSQL sessions."""
+        mock_session = MagicMock(spec=Session)
+        mock_connection = mock_session.connection.return_value
+        mock_connection.info = {}
+
+        def func_with_session(session):
+            return "success"
+
+        decorated_func = with_timeout(timeout=2.0)(func_with_session)
+        result = decorated_func(mock_session)
+
+        assert result == "success"
+        mock_connection.exec_driver_sql.assert_called_once_with("SET LOCAL statement_timeout = 2000")
+        
+        # A second call in the same transaction doesn't set it again
+        decorated_func(mock_session)
+        mock_connection.exec_driver_sql.assert_called_once()
+    
+    def test_statement_timeout_for_connection(self):
+        """Test that statement_timeout is set for Core connections too."""
+        mock_connection = MagicMock(spec=Connection)
+        mock_connection.info = {}
+
+        def func_with_connection(connection):
+            return "success"
+
+        decorated_func = with_timeout(timeout=2.0)(func_with_connection)
+        assert decorated_func(mock_connection) == "success"
+        
+        mock_connection.exec_driver_sql.assert_called_once_with("SET LOCAL statement_timeout = 2000")
+        
+        # A new transaction needs its own SET LOCAL
+        mock_connection.get_transaction.return_value = MagicMock()
+        decorated_func(mock_connection)
+        assert mock_connection.exec_driver_sql.call_count == 2
+    
+    def test_statement_timeout_skipped_when_default(self):
+        """Test that no SET is issued when the connection already has the timeout."""
+        mock_session = MagicMock(spec=Session)
+        mock_session.connection.return_value.info = {STATEMENT_TIMEOUT_INFO_KEY: 2000}
+
+        def func_with_session(session):
+            return "success"
+
+        decorated_func = with_timeout(timeout=2.0)(func_with_session)
+        result = decorated_func(mock_session)
+
+        assert result == "success"
+        mock_session.connection.return_value.exec_driver_sql.assert_not_called()
+    
+    def test_statement_timeout_restores_default_after_override(self):
+        """Test that a default-timeout call after a SET LOCAL override resets it."""
+        mock_connection = MagicMock(spec=Connection)
+        mock_connection.info = {STATEMENT_TIMEOUT_INFO_KEY: 2000}
+        
+        def func_with_connection(connection):
+            return "success"
+        
+        with_timeout(timeout=0.05)(func_with_connection)(mock_connection)
+        with_timeout(timeout=2.0)(func_with_connection)(mock_connection)
+        
+        # The second call must undo the 50ms override in the same transaction
+        assert [c.args[0] for c in mock_connection.exec_driver_sql.call_args_list] == [
+            "SET LOCAL statement_timeout = 50",
+            "SET LOCAL statement_timeout = 2000",
+        ]
+        
+        # A new transaction starts from the connection default again
+        mock_connection.get_transaction.return_value = MagicMock()
+        with_timeout(timeout=2.0)(func_with_connection)(mock_connection)
+        assert mock_connection.exec_driver_sql.call_count == 2
+    
+    def test_register_statement_timeout(self):
+        """Test that new connections get the default statement timeout."""
+        mock_engine = MagicMock()
+        mock_dbapi_connection = MagicMock()
+        mock_connection_record = MagicMock()
+        mock_connection_record.info = {}
+        
+        with patch('app.database.retry_handler.event.listen') as mock_listen:
+            register_statement_timeout(mock_engine, 2000)
+        
+        engine, event_name, listener = mock_listen.call_args.args
+        assert engine is mock_engine
+        assert event_name == "connect"
+        
+        listener(mock_dbapi_connection, mock_connection_record)
+        
+        mock_dbapi_connection.cursor.return_value.execute.assert_called_once_with(
+            "SET statement_timeout = 2000"
+        )
+        mock_dbapi_connection.commit.assert_called_once()
+        assert mock_connection_record.info == {STATEMENT_TIMEOUT_INFO_KEY: 2000}
+    
+    def test_register_statement_timeout_without_apply(self):
+        """Test that a timeout set by other means is only recorded."""
+        mock_dbapi_connection = MagicMock()
+        mock_connection_record = MagicMock()
+        mock_connection_record.info = {}
+        
+        with patch('app.database.retry_handler.event.listen') as mock_listen:
+            register_statement_timeout(MagicMock(), 2000, apply=False)
+        
+        _, _, listener = mock_listen.call_args.args
+        listener(mock_dbapi_connection, mock_connection_record)
+        
+        mock_dbapi_connection.cursor.assert_not_called()
+        assert mock_connection_record.info == {STATEMENT_TIMEOUT_INFO_KEY: 2000}
+
+
+class TestSafeDatabaseOperationTimeout:
+    """Test cases for the timeout budget of safe_db_operation."""
+    
+    @patch('time.monotonic')
+    def test_timeout_takes_precedence(self, mock_time):
+        # First call returns 0, then all subsequent calls return 2.0
+        mock_time.side_effect = chain([0], repeat(2.0))
+        
+        # Create a function that always fails with a retriable error
+        mock_func = MagicMock(
+            side_effect=sqlalchemy.exc.OperationalError("statement", {}, Exception("connection error"))
+        )
+        
+        decorated_func = safe_db_operation(max_retries=3, timeout=1.0)(mock_func)
+        
+        with pytest.raises(DatabaseTimeoutError):
+            decorated_func()
+        
+        assert mock_func.call_count == 1
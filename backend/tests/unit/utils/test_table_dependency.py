@@ -6,58 +6,142 @@ the functionality of the TableDependencyMap class.
 
 Part of the implementation for ENV-DB-2.4.3.1 (Create table dependency map)
 """
+from collections import defaultdict
+from types import MappingProxyType
+import gc
+import weakref
 import pytest
 from unittest.mock import Mock, patch, MagicMock
 from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, ForeignKey
 from sqlalchemy.engine import Engine
 
-from app.utils.table_dependency import TableDependencyMap, get_dependency_map
+from app.utils.table_dependency import (
+    TableDependencyMap,
+    clear_dependency_map_cache,
+    get_dependency_map,
+    quote_table_name
+)
+
+
+# Opaque engine for maps built from an injected inspector; never mutated
+_DUMMY_ENGINE = Mock(spec=Engine)
+
+# Expected results for the sample schema, built once at import time
+_ALL_TABLES = frozenset({"users", "posts", "comments", "tags", "post_tags"})
+_USERS_DEPENDED_BY = frozenset({"posts", "comments"})
+_USERS_DESCENDANTS = frozenset({"posts", "comments", "post_tags"})
+
+# Fragments expected in each print_dependency_tree format
+_TEXT_FRAGMENTS = ("DATABASE TABLE DEPENDENCIES", "users", "posts", "Depends on:", "Depended on by:")
+_MARKDOWN_FRAGMENTS = ("# Database Table Dependencies", "## users", "### Depends on:", "### Depended on by:")
+
+# Tables with circular dependencies
+_CIRCULAR_TABLES = ("a", "b", "c")
+
+# Circular foreign keys: a -> b -> c -> a
+_CIRCULAR_FKS = MappingProxyType({
+    "a": [{"referred_table": "c"}],  # a depends on c
+    "b": [{"referred_table": "a"}],  # b depends on a
+    "c": [{"referred_table": "b"}]   # c depends on b
+})
+
+# Tables based on the Photo Gallery schema
+_PHOTO_GALLERY_TABLES = (
+    "photos", "albums", "album_photos", "shared_links",
+    "generation_sessions", "generation_steps", "step_alternatives",
+    "models", "prompt_templates", "application_settings"
+)
+
+# Foreign keys based on the Photo Gallery schema
+_PHOTO_GALLERY_FKS = MappingProxyType({
+    "photos": [
+        {"referred_table": "photos"}  # source_image_id -> photos.id
+    ],
+    "albums": [
+        {"referred_table": "photos"}  # cover_photo_id -> photos.id
+    ],
+    "album_photos": [
+        {"referred_table": "albums"},  # album_id -> albums.id
+        {"referred_table": "photos"}   # photo_id -> photos.id
+    ],
+    "shared_links": [
+        {"referred_table": "photos"},  # photo_id -> photos.id
+        {"referred_table": "albums"}   # album_id -> albums.id
+    ],
+    "generation_sessions": [
+        {"referred_table": "photos"}  # source_image_id -> photos.id
+    ],
+    "generation_steps": [
+        {"referred_table": "generation_sessions"},  # session_id -> generation_sessions.id
+        {"referred_table": "generation_steps"},     # parent_id -> generation_steps.id
+        {"referred_table": "photos"}                # selected_image_id -> photos.id
+    ],
+    "step_alternatives": [
+        {"referred_table": "generation_steps"},  # step_id -> generation_steps.id
+        {"referred_table": "photos"}             # image_id -> photos.id
+    ],
+    "models": [],  # No foreign keys
+    "prompt_templates": [],  # No foreign keys
+    "application_settings": []  # No foreign keys
+})
+
+
+def sample_inspector():
+    """Set up a mock inspector with a sample database schema"""
+    mock_inspector = Mock()
+    
+    # Define tables
+    tables = ["users", "posts", "comments", "tags", "post_tags"]
+    mock_inspector.get_table_names.return_value = tables
+    
+    # Define foreign keys
+    foreign_keys = {
+        "users": [],  # No foreign keys
+        "posts": [
+            {"referred_table": "users"}  # posts.user_id -> users.id
+        ],
+        "comments": [
+            {"referred_table": "users"},  # comments.user_id -> users.id
+            {"referred_table": "posts"}   # comments.post_id -> posts.id
+        ],
+        "tags": [],  # No foreign keys
+        "post_tags": [
+            {"referred_table": "posts"},  # post_tags.post_id -> posts.id
+            {"referred_table": "tags"}    # post_tags.tag_id -> tags.id
+        ]
+    }
+    
+    mock_inspector.get_foreign_keys = defaultdict(list, foreign_keys).__getitem__
+    return mock_inspector
+
+
+@pytest.fixture(scope="module")
+def dep_map():
+    """Dependency map of the sample schema, shared by read-only tests"""
+    return TableDependencyMap(_DUMMY_ENGINE, inspector=sample_inspector())
+
+
+@pytest.fixture(scope="module")
+def order(dep_map):
+    """Truncation order of the sample schema, computed once per module"""
+    return tuple(dep_map.get_truncation_order())
+
+
+@pytest.fixture(scope="module")
+def indices(order):
+    """Position of each sample table in the truncation order"""
+    return {table: i for i, table in enumerate(order)}
 
 
 class TestTableDependencyMap:
     """Tests for TableDependencyMap class"""
     
-    def setup_mock_inspector(self):
-        """Set up a mock inspector with a sample database schema"""
-        mock_inspector = Mock()
-        
-        # Define tables
-        tables = ["users", "posts", "comments", "tags", "post_tags"]
-        mock_inspector.get_table_names.return_value = tables
-        
-        # Define foreign keys
-        foreign_keys = {
-            "users": [],  # No foreign keys
-            "posts": [
-                {"referred_table": "users"}  # posts.user_id -> users.id
-            ],
-            "comments": [
-                {"referred_table": "users"},  # comments.user_id -> users.id
-                {"referred_table": "posts"}   # comments.post_id -> posts.id
-            ],
-            "tags": [],  # No foreign keys
-            "post_tags": [
-                {"referred_table": "posts"},  # post_tags.post_id -> posts.id
-                {"referred_table": "tags"}    # post_tags.tag_id -> tags.id
-            ]
-        }
-        
-        mock_inspector.get_foreign_keys = lambda table: foreign_keys.get(table, [])
-        return mock_inspector
-    
-    @patch('sqlalchemy.inspect')
-    def test_build_dependencies(self, mock_inspect):
+    def test_build_dependencies(self, dep_map):
         """Test that dependencies are correctly built from database schema"""
-        # Set up mock inspector
-        mock_inspector = self.setup_mock_inspector()
-        mock_inspect.return_value = mock_inspector
-        
-        # Create dependency map with mock engine
-        engine = Mock(spec=Engine)
-        dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
+        dependency_map = dep_map
         
         # Verify tables
-        assert set(dependency_map.tables) == {"users", "posts", "comments", "tags", "post_tags"}
+        assert frozenset(dependency_map.tables) == _ALL_TABLES
         
         # Verify dependencies
         assert dependency_map.dependencies["users"] == set()
@@ -67,35 +151,20 @@ class TestTableDependencyMap:
         assert dependency_map.dependencies["post_tags"] == {"posts", "tags"}
         
         # Verify reverse dependencies
-        assert dependency_map.reverse_dependencies["users"] == {"posts", "comments"}
+        assert dependency_map.reverse_dependencies["users"] == _USERS_DEPENDED_BY
         assert dependency_map.reverse_dependencies["posts"] == {"comments", "post_tags"}
         assert dependency_map.reverse_dependencies["comments"] == set()
         assert dependency_map.reverse_dependencies["tags"] == {"post_tags"}
         assert dependency_map.reverse_dependencies["post_tags"] == set()
     
-    @patch('sqlalchemy.inspect')
-    def test_get_truncation_order(self, mock_inspect):
+    def test_get_truncation_order(self, dep_map, order, indices):
         """Test that truncation order is correctly determined"""
-        # Set up mock inspector
-        mock_inspector = self.setup_mock_inspector()
-        mock_inspect.return_value = mock_inspector
-        
-        # Create dependency map with mock engine
-        engine = Mock(spec=Engine)
-        dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
+        dependency_map = dep_map
         
-        # Get table truncation order: child first
-        truncation_order = dependency_map.get_truncation_order()
-        
-        # Verify order guarantees
+        # Verify order guarantees on the precomputed child-first order
         # 1. Comments should come before posts and users
         # 2. Post_tags should come before posts and tags
         # 3. Posts should come before users
-        
-        # Convert to indices for easier comparison
-        indices = {table: i for i, table in enumerate(truncation_order)}
-        
-        # Check constraints
         assert indices["comments"] < indices["posts"]
         assert indices["comments"] < indices["users"]
         assert indices["post_tags"] < indices["posts"]
@@ -103,25 +172,25 @@ class TestTableDependencyMap:
         assert indices["posts"] < indices["users"]
         
         # Verify complete order
-        expected_order = ["comments", "post_tags", "posts", "tags", "users"]
-        assert set(truncation_order) == set(expected_order)  # All tables should be included
+        assert frozenset(order) == _ALL_TABLES  # All tables should be included
         
         # Verify the order is valid
-        assert dependency_map.verify_truncation_order(truncation_order)
+        assert dependency_map.verify_truncation_order(list(order))
+        
+        # Verify the order is cached and callers get their own copy
+        truncation_order = dependency_map.get_truncation_order()
+        truncation_order.reverse()
+        assert dependency_map.get_truncation_order() == list(order)
+        with patch.object(dependency_map, '_compute_truncation_order') as mock_compute:
+            dependency_map.get_truncation_order()
+        mock_compute.assert_not_called()
     
-    @patch('sqlalchemy.inspect')
-    def test_get_dependent_tables(self, mock_inspect):
+    def test_get_dependent_tables(self, dep_map):
         """Test that dependent tables are correctly identified"""
-        # Set up mock inspector
-        mock_inspector = self.setup_mock_inspector()
-        mock_inspect.return_value = mock_inspector
-        
-        # Create dependency map with mock engine
-        engine = Mock(spec=Engine)
-        dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
+        dependency_map = dep_map
         
         # Verify dependent tables
-        assert dependency_map.get_dependent_tables("users") == {"posts", "comments", "post_tags"}
+        assert dependency_map.get_dependent_tables("users") == _USERS_DESCENDANTS
         assert dependency_map.get_dependent_tables("posts") == {"comments", "post_tags"}
         assert dependency_map.get_dependent_tables("comments") == set()
         assert dependency_map.get_dependent_tables("tags") == {"post_tags"}
@@ -130,40 +199,163 @@ class TestTableDependencyMap:
         # Check for non-existent table
         assert dependency_map.get_dependent_tables("non_existent") == set()
     
-    @patch('sqlalchemy.inspect')
-    def test_generate_dependency_graph(self, mock_inspect):
-        """Test that dependency graph is correctly generated"""
+    def test_parallel_reflection(self):
+        """Test that per-table reflection in threads builds the same graph"""
+        mock_inspector = sample_inspector()
+        engine = _DUMMY_ENGINE
+        
+        serial_map = TableDependencyMap(engine, inspector=mock_inspector)
+        parallel_map = TableDependencyMap(engine, inspector=mock_inspector, parallel_reflection=4)
+        
+        assert parallel_map.tables == serial_map.tables
+        assert parallel_map.dependencies == serial_map.dependencies
+        assert parallel_map.reverse_dependencies == serial_map.reverse_dependencies
+    
+    def test_dependency_arrays(self):
+        """Test that the CSR arrays match the dependency sets"""
+        mock_inspector = sample_inspector()
+        engine = _DUMMY_ENGINE
+        dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
+        
+        indptr, indices = dependency_map.dependency_arrays
+        
+        assert len(indptr) == len(dependency_map.tables) + 1
+        for table_id, table in enumerate(dependency_map.tables):
+            deps = {dependency_map.tables[dep] for dep in indices[indptr[table_id]:indptr[table_id + 1]]}
+            assert deps == dependency_map.dependencies[table]
+        
+        # Verify the arrays are cached on the instance
+        assert dependency_map.dependency_arrays[0] is indptr
+    
+    def test_get_truncation_batches(self):
+        """Test that independent tables are grouped into the same batch"""
+        # Set up mock inspector
+        mock_inspector = sample_inspector()
+        
+        # Create dependency map with mock engine
+        engine = _DUMMY_ENGINE
+        dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
+        
+        assert dependency_map.get_truncation_batches() == [
+            ["comments", "post_tags"],
+            ["posts", "tags"],
+            ["users"]
+        ]
+    
+    def test_truncate_all(self):
+        """Test that all tables are truncated with a single statement"""
+        # Set up mock inspector
+        mock_inspector = sample_inspector()
+        
+        # Create dependency map with mock engine
+        engine = _DUMMY_ENGINE
+        dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
+        
+        connection = MagicMock()
+        dependency_map.truncate_all(connection)
+        
+        connection.execute.assert_called_once()
+        sql = str(connection.execute.call_args[0][0])
+        assert sql.startswith("TRUNCATE TABLE ")
+        assert sql.endswith(" RESTART IDENTITY CASCADE")
+        for table in dependency_map.tables:
+            assert f'"{table}"' in sql
+    
+    def test_quote_table_name(self):
+        """Test that embedded quotes in table names are escaped"""
+        assert quote_table_name("users") == '"users"'
+        assert quote_table_name('odd"name') == '"odd""name"'
+    
+    def test_components(self):
+        """Test that tables are grouped into FK-independent components"""
+        # Add tables that share no foreign keys with the sample schema
+        mock_inspector = sample_inspector()
+        mock_inspector.get_table_names.return_value = [
+            "users", "posts", "comments", "tags", "post_tags", "audit_log", "settings"
+        ]
+        
+        # Create dependency map with mock engine
+        engine = _DUMMY_ENGINE
+        dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
+        
+        components = dependency_map.components()
+        
+        # Verify each table appears in exactly one component
+        assert sorted(map(sorted, components)) == [
+            ["audit_log"],
+            ["comments", "post_tags", "posts", "tags", "users"],
+            ["settings"]
+        ]
+        
+        # Verify each component keeps the truncation order
+        truncation_order = dependency_map.get_truncation_order()
+        for component in components:
+            assert component == [t for t in truncation_order if t in component]
+    
+    def test_exclude_partitions(self):
+        """Test that partitions covered by a partitioned ancestor are dropped"""
         # Set up mock inspector
-        mock_inspector = self.setup_mock_inspector()
-        mock_inspect.return_value = mock_inspector
+        mock_inspector = sample_inspector()
         
         # Create dependency map with mock engine
-        engine = Mock(spec=Engine)
+        engine = _DUMMY_ENGINE
         dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
         
+        # events is partitioned by year, events_2024 by month
+        dependency_map.partition_parents = {
+            "events_2023": "events",
+            "events_2024": "events",
+            "events_2024_01": "events_2024"
+        }
+        
+        assert dependency_map.partitioned_roots == {"events"}
+        assert dependency_map.exclude_partitions(
+            ["events_2024_01", "users", "events_2023", "events"]
+        ) == ["users", "events"]
+        assert dependency_map.exclude_partitions(
+            ["events_2024_01", "events_2024", "events_2023"]
+        ) == ["events_2024", "events_2023"]
+    
+    def test_all_descendants(self):
+        """Test that the dependent-table closure is computed once and reused"""
+        # Set up mock inspector
+        mock_inspector = sample_inspector()
+        
+        # Create dependency map with mock engine
+        engine = _DUMMY_ENGINE
+        dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
+        
+        all_descendants = dependency_map.all_descendants
+        
+        # Verify the closure matches get_dependent_tables for every table
+        assert all_descendants["users"] == _USERS_DESCENDANTS
+        assert all_descendants["comments"] == frozenset()
+        for table in dependency_map.tables:
+            assert all_descendants[table] == dependency_map.get_dependent_tables(table)
+        
+        # Verify the closure is cached on the instance
+        assert dependency_map.all_descendants is all_descendants
+    
+    def test_generate_dependency_graph(self, dep_map):
+        """Test that dependency graph is correctly generated"""
+        dependency_map = dep_map
+        
         # Generate dependency graph
         graph = dependency_map.generate_dependency_graph()
         
         # Verify graph structure
-        assert set(graph.keys()) == {"users", "posts", "comments", "tags", "post_tags"}
+        assert graph.keys() == _ALL_TABLES
         
         # Check a few entries
         assert graph["users"]["depends_on"] == []
-        assert set(graph["users"]["depended_by"]) == {"posts", "comments"}
+        assert frozenset(graph["users"]["depended_by"]) == _USERS_DEPENDED_BY
         
         assert set(graph["comments"]["depends_on"]) == {"users", "posts"}
         assert graph["comments"]["depended_by"] == []
     
-    @patch('sqlalchemy.inspect')
-    def test_verify_truncation_order(self, mock_inspect):
+    def test_verify_truncation_order(self, dep_map):
         """Test truncation order verification"""
-        # Set up mock inspector
-        mock_inspector = self.setup_mock_inspector()
-        mock_inspect.return_value = mock_inspector
-        
-        # Create dependency map with mock engine
-        engine = Mock(spec=Engine)
-        dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
+        dependency_map = dep_map
         
         # Valid order: child tables before parent tables
         valid_order = ["comments", "post_tags", "posts", "tags", "users"]
@@ -176,47 +368,30 @@ class TestTableDependencyMap:
         # Missing table
         incomplete_order = ["comments", "posts", "tags", "users"]
         assert not dependency_map.verify_truncation_order(incomplete_order)
+        
+        # Duplicated table
+        duplicated_order = valid_order + [valid_order[0]]
+        assert not dependency_map.verify_truncation_order(duplicated_order)
     
-    @patch('sqlalchemy.inspect')
-    def test_print_dependency_tree(self, mock_inspect):
+    def test_print_dependency_tree(self, dep_map):
         """Test dependency tree printing"""
-        # Set up mock inspector
-        mock_inspector = self.setup_mock_inspector()
-        mock_inspect.return_value = mock_inspector
-        
-        # Create dependency map with mock engine
-        engine = Mock(spec=Engine)
-        dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
+        dependency_map = dep_map
         
         # Get text representation
         text_output = dependency_map.print_dependency_tree("text")
         
-        # Basic checks
-        assert "DATABASE TABLE DEPENDENCIES" in text_output
-        assert "users" in text_output
-        assert "posts" in text_output
-        assert "Depends on:" in text_output
-        assert "Depended on by:" in text_output
+        # Basic checks, reporting every missing fragment at once
+        assert [f for f in _TEXT_FRAGMENTS if f not in text_output] == []
         
         # Get markdown representation
         md_output = dependency_map.print_dependency_tree("markdown")
         
         # Basic checks
-        assert "# Database Table Dependencies" in md_output
-        assert "## users" in md_output
-        assert "### Depends on:" in md_output
-        assert "### Depended on by:" in md_output
+        assert [f for f in _MARKDOWN_FRAGMENTS if f not in md_output] == []
     
-    @patch('sqlalchemy.inspect')
-    def test_factory_function(self, mock_inspect):
+    def test_factory_function(self, dep_map):
         """Test factory function for creating dependency map"""
-        # Set up mock inspector
-        mock_inspector = self.setup_mock_inspector()
-        mock_inspect.return_value = mock_inspector
-        
-        # Create dependency map with mock engine
-        engine = Mock(spec=Engine)
-        dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
+        dependency_map = dep_map
         
         # Verify it's the correct type
         assert isinstance(dependency_map, TableDependencyMap)
@@ -225,42 +400,225 @@ class TestTableDependencyMap:
         assert len(dependency_map.tables) > 0
 
 
+def test_get_dependency_map_cached_by_schema_signature():
+    """Test that dependency maps are reused until the schema signature changes"""
+    engine = MagicMock()
+    engine.dialect.name = "postgresql"
+    mock_conn = engine.connect.return_value.__enter__.return_value
+    mock_conn.execute.return_value.scalar.side_effect = ["sig1", "sig1", "sig2"]
+    
+    clear_dependency_map_cache()
+    try:
+        with patch('app.utils.table_dependency.TableDependencyMap') as mock_map_class:
+            mock_map_class.side_effect = lambda engine: Mock()
+            
+            first = get_dependency_map(engine)
+            second = get_dependency_map(engine)
+            third = get_dependency_map(engine)
+            
+            # Same signature reuses the map, a new signature rebuilds it
+            assert first is second
+            assert third is not first
+            assert mock_map_class.call_count == 2
+    finally:
+        clear_dependency_map_cache()
+
+
+def test_get_dependency_map_cache_does_not_keep_engine_alive():
+    """Test that the dependency map cache drops entries with their engine"""
+    engine = MagicMock()
+    engine.dialect.name = "postgresql"
+    mock_conn = engine.connect.return_value.__enter__.return_value
+    mock_conn.execute.return_value.scalar.return_value = "sig1"
+    
+    clear_dependency_map_cache()
+    with patch('app.utils.table_dependency.TableDependencyMap') as mock_map_class:
+        mock_map_class.side_effect = lambda engine: Mock()
+        get_dependency_map(engine)
+    
+    engine_ref = weakref.ref(engine)
+    del engine, mock_conn, mock_map_class
+    gc.collect()
+    assert engine_ref() is None
+
+
+
+def test_cached_map_keeps_engine_attribute():
+    """Test that a map holding its engine weakly still exposes it while alive"""
+    engine = Mock(spec=Engine)
+    dependency_map = TableDependencyMap(engine, inspector=sample_inspector())
+    dependency_map._hold_engine_weakly()
+    
+    assert dependency_map.engine is engine
+    
+    del engine
+    gc.collect()
+    assert dependency_map.engine is None
+
+def test_get_dependency_map_not_cached_for_other_dialects():
+    """Test that dependency maps are rebuilt on dialects without a signature query"""
+    engine = Mock()
+    engine.dialect.name = "sqlite"
+    
+    with patch('app.utils.table_dependency.TableDependencyMap') as mock_map_class:
+        mock_map_class.side_effect = lambda engine: Mock()
+        
+        assert get_dependency_map(engine) is not get_dependency_map(engine)
+        engine.connect.assert_not_called()
+
+
 def test_with_circular_dependencies():
     """Test handling of circular dependencies"""
     # Create a mock inspector with circular dependencies
     mock_inspector = Mock()
     
-    # Define tables with circular dependencies
-    tables = ["a", "b", "c"]
-    mock_inspector.get_table_names.return_value = tables
+    tables = _CIRCULAR_TABLES
+    mock_inspector.get_table_names.return_value = list(tables)
+    mock_inspector.get_foreign_keys = defaultdict(list, _CIRCULAR_FKS).__getitem__
+    
+    # Create dependency map with mock engine
+    engine = _DUMMY_ENGINE
+    dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
+    
+    # Try to get truncation order
+    order = dependency_map.get_truncation_order()
+    
+    # Verify we got an order despite circular dependencies
+    assert len(order) == 3
+    assert set(order) == {"a", "b", "c"}
     
-    # Define circular foreign keys: a -> b -> c -> a
+    # Verify that there indeed exists circularity
+    circular_deps = dependency_map._find_circular_dependencies()
+    expected_edges = {('a', 'c'), ('c', 'b'), ('b', 'a')}
+    assert len(circular_deps) > 0
+    assert expected_edges.issubset(circular_deps)
+    
+    # Verify every table in the cycle depends on every other one
+    for table in tables:
+        assert dependency_map.get_dependent_tables(table) == {"a", "b", "c"}
+
+
+def test_cycle_breaking_keeps_acyclic_part_ordered():
+    """Test that breaking a cycle doesn't disturb the order of other tables"""
+    mock_inspector = Mock()
+    mock_inspector.get_table_names.return_value = ["users", "a", "b", "c"]
+    
+    # a <-> b form a cycle; both reference users, c references a
     foreign_keys = {
-        "a": [{"referred_table": "c"}],  # a depends on c
-        "b": [{"referred_table": "a"}],  # b depends on a
-        "c": [{"referred_table": "b"}]   # c depends on b
+        "a": [{"referred_table": "b"}, {"referred_table": "users"}],
+        "b": [{"referred_table": "a"}, {"referred_table": "users"}],
+        "c": [{"referred_table": "a"}]
     }
+    mock_inspector.get_foreign_keys = defaultdict(list, foreign_keys).__getitem__
     
-    mock_inspector.get_foreign_keys = lambda table: foreign_keys.get(table, [])
+    engine = _DUMMY_ENGINE
+    dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
+    order = dependency_map.get_truncation_order()
     
-    # Create dependency map
-    with patch('sqlalchemy.inspect', return_value=mock_inspector):
-        # Create dependency map with mock engine
-        engine = Mock(spec=Engine)
-        dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
-        
-        # Try to get truncation order
+    assert sorted(order) == ["a", "b", "c", "users"]
+    assert order[-1] == "users"
+    assert order.index("c") < order.index("a")
+    assert dependency_map.verify_truncation_order(order)
+
+
+def test_build_dependencies_postgresql_queries():
+    """Test that PostgreSQL schemas are read with one query per kind of data"""
+    engine = MagicMock()
+    engine.dialect.name = "postgresql"
+    conn = engine.connect.return_value.__enter__.return_value
+    
+    tables_result = MagicMock()
+    tables_result.scalars.return_value = ["comments", "posts", "users"]
+    edges_result = MagicMock()
+    edges_result.all.return_value = [("posts", "users"), ("comments", "posts")]
+    partitions_result = MagicMock()
+    partitions_result.all.return_value = []
+    conn.execute.side_effect = [tables_result, edges_result, partitions_result]
+    
+    with patch('app.utils.table_dependency.inspect') as mock_inspect:
+        dependency_map = TableDependencyMap(engine)
+    
+    # Verify no per-table reflection happened
+    mock_inspect.assert_not_called()
+    assert conn.execute.call_count == 3
+    
+    assert dependency_map.tables == ["comments", "posts", "users"]
+    assert dependency_map.dependencies == {
+        "comments": {"posts"}, "posts": {"users"}, "users": set()
+    }
+    assert dependency_map.reverse_dependencies == {
+        "comments": set(), "posts": {"comments"}, "users": {"posts"}
+    }
+    assert dependency_map.get_truncation_order() == ["comments", "posts", "users"]
+
+
+def sample_metadata():
+    """Build MetaData for a small users/posts/comments schema"""
+    metadata = MetaData()
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    Table(
+        "posts", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id"))
+    )
+    Table(
+        "comments", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("post_id", Integer, ForeignKey("posts.id")),
+        Column("user_id", Integer, ForeignKey("users.id"))
+    )
+    return metadata
+
+
+def test_build_dependencies_bulk_reflection():
+    """Test that other dialects reflect all foreign keys through one inspector"""
+    engine = create_engine("sqlite://")
+    sample_metadata().create_all(engine)
+    
+    dependency_map = TableDependencyMap(engine)
+    
+    assert dependency_map.dependencies == {
+        "comments": {"posts", "users"}, "posts": {"users"}, "users": set()
+    }
+    assert dependency_map.get_truncation_order() == ["comments", "posts", "users"]
+
+
+def test_from_cached_metadata():
+    """Test that a map can be built from MetaData without any queries"""
+    dependency_map = TableDependencyMap.from_cached_metadata(sample_metadata())
+    
+    assert dependency_map.engine is None
+    assert dependency_map.tables == ["comments", "posts", "users"]
+    assert dependency_map.reverse_dependencies == {
+        "comments": set(), "posts": {"comments"}, "users": {"comments", "posts"}
+    }
+    assert dependency_map.get_truncation_order() == ["comments", "posts", "users"]
+
+
+def test_self_referencing_table_order():
+    """Test that a self-referencing table doesn't count as a dependency cycle"""
+    mock_inspector = Mock()
+    mock_inspector.get_table_names.return_value = ["folders", "files"]
+    foreign_keys = {
+        "folders": [{"referred_table": "folders"}],  # folders.parent_id -> folders.id
+        "files": [{"referred_table": "folders"}]     # files.folder_id -> folders.id
+    }
+    mock_inspector.get_foreign_keys = defaultdict(list, foreign_keys).__getitem__
+    
+    engine = _DUMMY_ENGINE
+    dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
+    
+    with patch.object(dependency_map, '_order_with_cycles') as mock_order_with_cycles:
         order = dependency_map.get_truncation_order()
-        
-        # Verify we got an order despite circular dependencies
-        assert len(order) == 3
-        assert set(order) == {"a", "b", "c"}
-        
-        # Verify that there indeed exists circularity
-        circular_deps = dependency_map._find_circular_dependencies()
-        expected_edges = {('a', 'c'), ('c', 'b'), ('b', 'a')}
-        assert len(circular_deps) > 0
-        assert expected_edges.issubset(circular_deps)
+    
+    mock_order_with_cycles.assert_not_called()
+    assert order == ["files", "folders"]
+    
+    # Verify the self-reference is kept in the dependent tables
+    assert dependency_map.all_descendants == {
+        "folders": frozenset({"folders", "files"}),
+        "files": frozenset()
+    }
 
 
 def test_real_photo_gallery_schema():
@@ -271,74 +629,33 @@ def test_real_photo_gallery_schema():
     # Mock inspector with Photo Gallery schema
     mock_inspector = Mock()
     
-    # Define tables based on Photo Gallery schema
-    tables = [
-        "photos", "albums", "album_photos", "shared_links",
-        "generation_sessions", "generation_steps", "step_alternatives",
-        "models", "prompt_templates", "application_settings"
-    ]
+    tables = _PHOTO_GALLERY_TABLES
+    mock_inspector.get_table_names.return_value = list(tables)
+    mock_inspector.get_foreign_keys = defaultdict(list, _PHOTO_GALLERY_FKS).__getitem__
     
-    mock_inspector.get_table_names.return_value = tables
+    # Create dependency map
+    engine = _DUMMY_ENGINE
+    dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
     
-    # Define foreign keys based on schema
-    foreign_keys = {
-        "photos": [
-            {"referred_table": "photos"}  # source_image_id -> photos.id
-        ],
-        "albums": [
-            {"referred_table": "photos"}  # cover_photo_id -> photos.id
-        ],
-        "album_photos": [
-            {"referred_table": "albums"},  # album_id -> albums.id
-            {"referred_table": "photos"}   # photo_id -> photos.id
-        ],
-        "shared_links": [
-            {"referred_table": "photos"},  # photo_id -> photos.id
-            {"referred_table": "albums"}   # album_id -> albums.id
-        ],
-        "generation_sessions": [
-            {"referred_table": "photos"}  # source_image_id -> photos.id
-        ],
-        "generation_steps": [
-            {"referred_table": "generation_sessions"},  # session_id -> generation_sessions.id
-            {"referred_table": "generation_steps"},     # parent_id -> generation_steps.id
-            {"referred_table": "photos"}                # selected_image_id -> photos.id
-        ],
-        "step_alternatives": [
-            {"referred_table": "generation_steps"},  # step_id -> generation_steps.id
-            {"referred_table": "photos"}             # image_id -> photos.id
-        ],
-        "models": [],  # No foreign keys
-        "prompt_templates": [],  # No foreign keys
-        "application_settings": []  # No foreign keys
-    }
+    # Get truncation order
+    order = dependency_map.get_truncation_order()
     
-    mock_inspector.get_foreign_keys = lambda table: foreign_keys.get(table, [])
+    # Verify all tables are included
+    assert set(order) == set(tables)
     
-    # Create dependency map
-    with patch('sqlalchemy.inspect', return_value=mock_inspector):
-        engine = Mock(spec=Engine)
-        dependency_map = TableDependencyMap(engine, inspector=mock_inspector)
-        
-        # Get truncation order
-        order = dependency_map.get_truncation_order()
-        
-        # Verify all tables are included
-        assert set(order) == set(tables)
-        
-        # Print the order for debugging
-        print(f"Truncation order: {order}")
-        
-        # Verify order is valid
-        assert dependency_map.verify_truncation_order(order)
-        
-        # Verify specific ordering constraints
-        indices = {table: i for i, table in enumerate(order)}
-        
-        # Check some key relationships
-        assert indices["step_alternatives"] < indices["generation_steps"]
-        assert indices["generation_steps"] < indices["generation_sessions"]
-        assert indices["album_photos"] < indices["albums"]
-        assert indices["album_photos"] < indices["photos"]
-        assert indices["shared_links"] < indices["albums"]
-        assert indices["shared_links"] < indices["photos"]
\ No newline at end of file
+    # Print the order for debugging
+    print(f"Truncation order: {order}")
+    
+    # Verify order is valid
+    assert dependency_map.verify_truncation_order(order)
+    
+    # Verify specific ordering constraints
+    indices = {table: i for i, table in enumerate(order)}
+    
+    # Check some key relationships
+    assert indices["step_alternatives"] < indices["generation_steps"]
+    assert indices["generation_steps"] < indices["generation_sessions"]
+    assert indices["album_photos"] < indices["albums"]
+    assert indices["album_photos"] < indices["photos"]
+    assert indices["shared_links"] < indices["albums"]
+    assert indices["shared_links"] < indices["photos"]
\ No newline at end of file